@@ -8,15 +8,65 @@ class Settings(BaseSettings):
     AZURE_OPENAI_ENDPOINT: str = "https://agrostandai-openai-instance.openai.azure.com/"
     AZURE_OPENAI_API_VERSION: str = "2024-12-01-preview"
     AZURE_OPENAI_DEPLOYMENT_NAME: str = "gpt-4o"
+
+    # OpenAI HTTP client (shared async connection pool)
+    OPENAI_MAX_CONCURRENCY: int = 32
+    OPENAI_MAX_CONNECTIONS: int = 50
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    OPENAI_TIMEOUT: float = 60.0
+    OPENAI_CONNECT_TIMEOUT: float = 10.0
+    OPENAI_MAX_RETRIES: int = 2
     
     # Twilio Configuration
     TWILIO_ACCOUNT_SID: Optional[str] = None
     TWILIO_AUTH_TOKEN: Optional[str] = None
     TWILIO_PHONE_NUMBER: Optional[str] = None  # WhatsApp number (e.g., 'whatsapp:+14155238886')
+
+    # Outbound WhatsApp dispatcher (async, pooled Twilio REST calls)
+    OUTBOUND_DISPATCHER_ENABLED: bool = True
+    OUTBOUND_WORKER_COUNT: int = 8
+    OUTBOUND_MAX_RETRIES: int = 4
+    OUTBOUND_BACKOFF_BASE: float = 0.5
+    OUTBOUND_BACKOFF_MAX: float = 8.0
+    OUTBOUND_MAX_CONNECTIONS: int = 20
     
     # MongoDB Configuration
     MONGO_URI: Optional[str] = None
     DATABASE_NAME: str = "crop_disease_bot"
+    MONGO_MAX_POOL_SIZE: int = 100
+    MONGO_MIN_POOL_SIZE: int = 0
+    MONGO_WRITE_CONCERN: str = "1"  # "majority" or number of acknowledging nodes
+    MONGO_JOURNAL: bool = False
+    HISTORY_CACHE_DEPTH: int = 20  # messages fetched per history read
+    HISTORY_CACHE_TTL: float = 60.0
+    HISTORY_CACHE_MAX_USERS: int = 10000
+    PHONE_CACHE_TTL: float = 3600.0  # user_id -> phone number copied onto saved messages
+    PHONE_CACHE_MAX_USERS: int = 50000
+    MESSAGE_WRITE_BEHIND: bool = True  # queue message inserts and write them in batches
+    MESSAGE_FLUSH_INTERVAL: float = 0.5  # seconds between batch writes
+    MESSAGE_FLUSH_BATCH: int = 200  # documents per insert_many (a full batch flushes early)
+    MESSAGE_BUFFER_MAX: int = 20000  # queued documents before save_message waits for a flush
+    MESSAGE_FLUSH_MAX_ATTEMPTS: int = 5  # non-transient failures before a message is dead-lettered
+
+    # Image Blob Store ("gridfs" or "local")
+    BLOB_STORE_BACKEND: str = "gridfs"
+    BLOB_STORE_PATH: str = "data/blobs"
+
+    # Image Preprocessing (before vision analysis and storage)
+    IMAGE_PREPROCESS_ENABLED: bool = True
+    IMAGE_MAX_EDGE: int = 1024
+    IMAGE_JPEG_QUALITY: int = 85
+
+    # Near-duplicate Photo Detection (perceptual hash in front of image analysis)
+    IMAGE_DEDUP_ENABLED: bool = True
+    IMAGE_DEDUP_MAX_DISTANCE: int = 4  # max differing bits of the 64-bit hash
+    IMAGE_DEDUP_TTL: float = 259200.0  # 3 days
+    IMAGE_DEDUP_MAX_ENTRIES: int = 10000
+
+    # Media Downloads (streamed from Twilio over a pooled client)
+    MEDIA_MAX_BYTES: int = 10 * 1024 * 1024
+    MEDIA_DOWNLOAD_TIMEOUT: float = 30.0
+    MEDIA_MAX_CONNECTIONS: int = 20
     
     # Bot Configuration
     MAX_MESSAGE_LENGTH: int = 1500
@@ -37,11 +87,44 @@ class Settings(BaseSettings):
     IMAGE_ANALYSIS_TEMPERATURE: float = 0.2
     TEXT_CHAT_TEMPERATURE: float = 0.35
     CONFIDENCE_THRESHOLD: float = 0.7
+    STREAM_TEXT_REPLIES: bool = True  # send chat replies chunk by chunk while GPT-4o is still generating
+    WHATSAPP_CHUNK_LENGTH: int = 1500  # Twilio's limit is 1600 characters
     
     # Rate Limiting
     REQUESTS_PER_MINUTE: int = 60
     REQUESTS_PER_HOUR: int = 1000
 
+    # Webhook Processing (acknowledge-then-process mode)
+    WEBHOOK_ASYNC_MODE: bool = False
+    WEBHOOK_WORKER_COUNT: int = 4
+    WEBHOOK_QUEUE_SIZE: int = 500
+    WEBHOOK_DRAIN_TIMEOUT: float = 10.0
+
+    # Conversation Sessions
+    SESSION_BACKEND: str = "memory"  # "memory", "redis" (shared across workers) or "local" (tests)
+    REDIS_URL: str = "redis://localhost:6379/0"
+    SESSION_KEY_PREFIX: str = "whatsapp-bot:session:"
+    SESSION_SHARDS: int = 64
+    SESSION_EXPIRY_TICK: float = 5.0  # seconds per expiry-wheel slot
+    SESSION_IMAGE_CACHE_MB: int = 64  # base64 images referenced by live session messages
+    SESSION_SNAPSHOT_BACKEND: str = "file"  # "file", "mongo" or "none"; only used with the memory backend
+    SESSION_SNAPSHOT_PATH: str = "data/session_snapshot.jsonl"
+    SESSION_SNAPSHOT_INTERVAL: float = 60.0
+    SESSION_RESTORE_BATCH: int = 500
+
+    # Follow-up Response Cache (treatment / prevention / medicine answers)
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_TTL: float = 86400.0
+    RESPONSE_CACHE_MAX_ENTRIES: int = 5000
+    RESPONSE_CACHE_MAX_GENERIC_WORDS: int = 4  # longer follow-ups are treated as personalized and not cached
+    SESSION_MAX_MESSAGES: int = 30
+    SESSION_TIMEOUT: int = 3600  # seconds
+    CONTEXT_TOKEN_BUDGET: int = 6000  # estimated prompt tokens per request, system prompt included
+    SUMMARY_ENABLED: bool = True
+    SUMMARY_TRIGGER_MESSAGES: int = 20  # live messages before older turns are folded into the summary
+    SUMMARY_KEEP_RECENT: int = 8
+    SUMMARY_MAX_TOKENS: int = 300
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
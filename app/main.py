@@ -1,5 +1,15 @@
 from fastapi import FastAPI
+import asyncio
+from app.config import settings
 from app.routes import main_router
+from app.routes.whatsapp_routes import process_inbound_message
+from app.services.webhook_queue import webhook_queue
+from app.services.gemini_api import close_openai_client
+from app.services.conversation_summarizer import conversation_summarizer
+from app.services.mongo_db import ensure_indexes, start_message_buffer, stop_message_buffer
+from app.services.outbound_dispatcher import outbound_dispatcher
+from app.services.media_fetcher import media_fetcher
+from app.services.session_snapshots import session_snapshotter
 
 app = FastAPI(
     title="WhatsApp AI Bot",
@@ -12,4 +22,28 @@ app = FastAPI(
 async def root():
     return {"message": "WhatsApp AI Bot is running!", "status": "healthy"}
 
+@app.on_event("startup")
+async def start_background_workers():
+    """Start index bootstrap, the message write buffer, session restore/snapshots, the outbound dispatcher and (in acknowledge-then-process mode) the webhook workers"""
+    # Build indexes in the background so an unreachable database does not block startup
+    app.state.index_bootstrap = asyncio.create_task(ensure_indexes())
+    await start_message_buffer()
+    # Restores the last session snapshot in the background; requests are served meanwhile
+    await session_snapshotter.start()
+    if settings.OUTBOUND_DISPATCHER_ENABLED:
+        await outbound_dispatcher.start()
+    if settings.WEBHOOK_ASYNC_MODE:
+        await webhook_queue.start(process_inbound_message)
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    """Drain queued webhook messages, flush queued message writes and close shared clients before the process exits"""
+    await webhook_queue.stop(drain_timeout=settings.WEBHOOK_DRAIN_TIMEOUT)
+    await outbound_dispatcher.stop(drain_timeout=settings.WEBHOOK_DRAIN_TIMEOUT)
+    await stop_message_buffer()
+    await conversation_summarizer.stop()
+    await session_snapshotter.stop()
+    await close_openai_client()
+    await media_fetcher.close()
+
 app.include_router(main_router)
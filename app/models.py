@@ -27,7 +27,8 @@ class MessageSchema(BaseModel):
     user_id: str
     phone_number: Optional[str] = ""
     message: Optional[str] = ""
-    image_base64: Optional[str] = ""
+    image_base64: Optional[str] = ""  # legacy inline images; new messages use image_ref
+    image_ref: Optional[str] = ""  # blob store reference (SHA-256 of the image bytes)
     crop_type: Optional[str] = ""
     is_bot: bool = False
     timestamp: datetime = Field(default_factory=datetime.now)
@@ -257,20 +257,22 @@ async def send_post_call_followup(phone_number: str, call_summary: Dict[str, Any
             send_whatsapp_message(phone_number, chunk_with_indicator)
             
             # Save each chunk to database
-            save_message(
+            await save_message(
                 user_id=user_id,
                 message=chunk,
                 is_bot=True,
-                crop_type="ai_voice_analysis"
+                crop_type="ai_voice_analysis",
+                phone_number=phone_number
             )
         
         # Save AI analysis as separate detailed message for records
         if 'ai_analysis' in ai_analysis:
-            save_message(
+            await save_message(
                 user_id=user_id,
                 message=f"AI Analysis: {ai_analysis['ai_analysis']}",
                 is_bot=True,
-                crop_type="voice_call_ai_analysis"
+                crop_type="voice_call_ai_analysis",
+                phone_number=phone_number
             )
         
         # Save call summary
@@ -279,11 +281,12 @@ async def send_post_call_followup(phone_number: str, call_summary: Dict[str, Any
         if recording_url:
             call_summary_text += f"\nRecording: {recording_url}"
             
-        save_message(
+        await save_message(
             user_id=user_id,
             message=call_summary_text,
             is_bot=True,
-            crop_type="voice_call_summary"
+            crop_type="voice_call_summary",
+            phone_number=phone_number
         )
         
         print(f"[AI_FOLLOWUP] Sent sophisticated AI analysis to {phone_number}")
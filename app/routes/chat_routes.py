@@ -18,14 +18,14 @@ async def handle_text_chat(req: TextChatRequest):
             raise HTTPException(status_code=400, detail="user_id and message are required")
 
         # Save user (only once, prevents duplicates)
-        save_user(req.user_id, "", req.user_name or "")
+        await save_user(req.user_id, "", req.user_name or "")
 
         # Get AI response with crop type (this now includes session management)
         reply, crop_type = await chat_with_gpt(req.message, req.user_id)
 
         # Save user message to database
         user_crop_type = extract_crop_type_from_ai_response(req.message) if not crop_type else crop_type
-        save_message(
+        await save_message(
             user_id=req.user_id,
             message=req.message,
             is_bot=False,
@@ -33,7 +33,7 @@ async def handle_text_chat(req: TextChatRequest):
         )
 
         # Save bot reply to database
-        save_message(
+        await save_message(
             user_id=req.user_id,
             message=reply,
             is_bot=True,
@@ -41,7 +41,7 @@ async def handle_text_chat(req: TextChatRequest):
         )
 
         # Get session info
-        session_info = get_user_session_info(req.user_id)
+        session_info = await get_user_session_info(req.user_id)
 
         return {
             "user_id": req.user_id,
@@ -56,7 +56,7 @@ async def handle_text_chat(req: TextChatRequest):
     except Exception as e:
         error_reply = f"⚠️ Kuch problem hui hai. Phir se try kariye. (Error: {str(e)})"
         # Save error message too
-        save_message(
+        await save_message(
             user_id=req.user_id,
             message=error_reply,
             is_bot=True,
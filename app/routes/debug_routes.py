@@ -1,6 +1,19 @@
 from fastapi import APIRouter
 from app.config import settings
 from app.services.gemini_api import get_active_sessions_count, get_all_sessions_info
+from app.services.webhook_queue import webhook_queue
+from app.services.outbound_dispatcher import outbound_dispatcher
+from app.services.media_preprocessor import media_preprocessor
+from app.services.media_fetcher import media_fetcher
+from app.services.prompts import prompt_usage
+from app.services.session_manager import session_manager
+from app.services.conversation_summarizer import conversation_summarizer
+from app.services.session_snapshots import session_snapshotter
+from app.services.response_cache import response_cache
+from app.services.image_dedup import image_dedup
+from app.services.keyword_matcher import keyword_automaton, match_keywords
+from app.services.message_router import message_router
+from app.services.mongo_db import history_cache, blob_store, message_buffer, phone_cache, user_registration_stats, get_index_report
 import os
 
 router = APIRouter()
@@ -34,6 +47,99 @@ async def debug_sessions():
     """Debug endpoint to check session manager status"""
     return {
         "session_manager_status": "active",
-        "active_sessions": get_active_sessions_count(),
-        "all_sessions": get_all_sessions_info()
-    }
\ No newline at end of file
+        "active_sessions": await get_active_sessions_count(),
+        "all_sessions": await get_all_sessions_info()
+    }
+
+@router.get("/debug/webhook-queue")
+async def debug_webhook_queue():
+    """Debug endpoint to check webhook queue depth, workers and stage latency"""
+    return webhook_queue.get_stats()
+
+@router.get("/debug/history-cache")
+async def debug_history_cache():
+    """Debug endpoint to check the per-user message history cache"""
+    return history_cache.get_stats()
+
+@router.get("/debug/blob-store")
+async def debug_blob_store():
+    """Debug endpoint to check image blob store usage and deduplication"""
+    return blob_store.get_stats()
+
+@router.get("/debug/indexes")
+async def debug_indexes(sample_user_id: str = ""):
+    """Admin endpoint to check index build status and query plans for user/message lookups"""
+    return await get_index_report(sample_user_id)
+
+@router.get("/debug/outbound")
+async def debug_outbound():
+    """Debug endpoint to check the outbound WhatsApp dispatcher backlog and retries"""
+    return outbound_dispatcher.get_stats()
+
+@router.get("/debug/media")
+async def debug_media():
+    """Debug endpoint to check image preprocessing totals and bytes saved"""
+    return media_preprocessor.get_stats()
+
+@router.get("/debug/media-downloads")
+async def debug_media_downloads():
+    """Debug endpoint to check media download latency, throughput and size-cap aborts"""
+    return media_fetcher.get_stats()
+
+@router.get("/debug/prompts")
+async def debug_prompts():
+    """Debug endpoint to check prompt prefix versions and per-section token usage"""
+    return prompt_usage.get_stats()
+
+@router.get("/debug/context")
+async def debug_context():
+    """Debug endpoint to check tokens saved by the budgeted context builder"""
+    return session_manager.context_builder.get_stats()
+
+@router.get("/debug/summarizer")
+async def debug_summarizer():
+    """Debug endpoint to check background conversation summarization"""
+    return conversation_summarizer.get_stats()
+
+@router.get("/debug/session-store")
+async def debug_session_store():
+    """Debug endpoint to check session store shards and expiry-wheel activity"""
+    return session_manager.store.get_stats()
+
+@router.get("/debug/session-snapshots")
+async def debug_session_snapshots():
+    """Debug endpoint to check session snapshot timing and warm-restore progress"""
+    return session_snapshotter.get_stats()
+
+@router.get("/debug/response-cache")
+async def debug_response_cache():
+    """Debug endpoint to check follow-up response cache hit rates per (intent, crop, disease, language)"""
+    return response_cache.get_stats()
+
+@router.get("/debug/image-dedup")
+async def debug_image_dedup():
+    """Debug endpoint to check near-duplicate photo hits and analysis time saved"""
+    return image_dedup.get_stats()
+
+@router.get("/debug/keywords")
+async def debug_keywords(message: str = ""):
+    """Debug endpoint to check which routing keywords a message matches"""
+    return {
+        "patterns": len(keyword_automaton.patterns),
+        "matches": match_keywords(message).to_dict()
+    }
+
+@router.get("/debug/router")
+async def debug_router():
+    """Debug endpoint to check which routes inbound messages took and classification time"""
+    return message_router.get_stats()
+
+@router.get("/debug/write-buffer")
+async def debug_write_buffer():
+    """Debug endpoint to check queued message writes, batch sizes and flush latency"""
+    return message_buffer.get_stats()
+
+@router.get("/debug/phone-cache")
+async def debug_phone_cache():
+    """Debug endpoint to check phone lookups skipped on message saves and user registrations"""
+    return {**phone_cache.get_stats(), "user_registration": user_registration_stats}
@@ -1,7 +1,9 @@
 from fastapi import APIRouter, HTTPException
 from app.services.mongo_db import save_user, save_message
 from app.services.gemini_api import analyze_crop_image, get_user_session_info
+from app.services.media_preprocessor import media_preprocessor
 from app.models import ImageRequest
+import base64
 
 router = APIRouter()
 
@@ -14,7 +16,11 @@ async def handle_image_upload(payload: ImageRequest):
             raise HTTPException(status_code=400, detail="user_id and base64_image are required")
 
         # Save user (only once)
-        save_user(payload.user_id, "", payload.user_name or "")
+        await save_user(payload.user_id, "", payload.user_name or "")
+
+        # Downscale and strip EXIF before analysis and storage
+        image_bytes, _ = await media_preprocessor.process_async(base64.b64decode(payload.base64_image))
+        payload.base64_image = base64.b64encode(image_bytes).decode('utf-8')
 
         # Enhanced image analysis with session management
         diagnosis, crop_type = await analyze_crop_image(
@@ -23,7 +29,7 @@ async def handle_image_upload(payload: ImageRequest):
         )
 
         # Save image upload to database (store base64 instead of message)
-        save_message(
+        await save_message(
             user_id=payload.user_id,
             message="",  # Empty message for image
             image_base64=payload.base64_image,
@@ -32,7 +38,7 @@ async def handle_image_upload(payload: ImageRequest):
         )
 
         # Save diagnosis to database
-        save_message(
+        await save_message(
             user_id=payload.user_id,
             message=diagnosis,
             is_bot=True,
@@ -40,7 +46,7 @@ async def handle_image_upload(payload: ImageRequest):
         )
 
         # Get session info
-        session_info = get_user_session_info(payload.user_id)
+        session_info = await get_user_session_info(payload.user_id)
 
         return {
             "user_id": payload.user_id,
@@ -54,7 +60,7 @@ async def handle_image_upload(payload: ImageRequest):
 
     except Exception as e:
         error_msg = f"⚠️ Image analysis mein problem: {str(e)}"
-        save_message(
+        await save_message(
             user_id=payload.user_id,
             message=error_msg,
             is_bot=True,
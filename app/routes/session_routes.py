@@ -11,7 +11,7 @@ router = APIRouter()
 @router.get("/session/{user_id}")
 async def get_session_info(user_id: str):
     """Get session information for a specific user"""
-    session_info = get_user_session_info(user_id)
+    session_info = await get_user_session_info(user_id)
     if session_info:
         return {
             "user_id": user_id,
@@ -27,7 +27,7 @@ async def get_session_info(user_id: str):
 @router.delete("/session/{user_id}")
 async def clear_session(user_id: str):
     """Clear a user's session"""
-    success = clear_user_conversation(user_id)
+    success = await clear_user_conversation(user_id)
     return {
         "user_id": user_id,
         "cleared": success,
@@ -37,8 +37,8 @@ async def clear_session(user_id: str):
 @router.get("/sessions/stats")
 async def get_sessions_stats():
     """Get statistics about all active sessions"""
-    stats = get_all_sessions_info()
+    stats = await get_all_sessions_info()
     return {
-        "active_sessions": get_active_sessions_count(),
+        "active_sessions": await get_active_sessions_count(),
         "stats": stats
     }
\ No newline at end of file
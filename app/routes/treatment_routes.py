@@ -12,16 +12,16 @@ async def get_treatment_details(req: TreatmentRequest):
     """Get detailed treatment information with session context"""
     try:
         # Get detailed treatment guidance with session context
-        treatment_details = get_treatment_followup(req.disease, req.crop, req.user_id)
+        treatment_details = await get_treatment_followup(req.disease, req.crop, req.user_id)
         
         # Save interaction to database
-        save_message(
+        await save_message(
             user_id=req.user_id,
             message=f"Treatment request: {req.disease} in {req.crop}",
             is_bot=False,
             crop_type=req.crop
         )
-        save_message(
+        await save_message(
             user_id=req.user_id,
             message=treatment_details,
             is_bot=True,
@@ -29,7 +29,7 @@ async def get_treatment_details(req: TreatmentRequest):
         )
         
         # Get session info
-        session_info = get_user_session_info(req.user_id)
+        session_info = await get_user_session_info(req.user_id)
         
         return {
             "user_id": req.user_id,
@@ -44,7 +44,7 @@ async def get_treatment_details(req: TreatmentRequest):
         
     except Exception as e:
         error_msg = f"Treatment info mein problem: {str(e)}"
-        save_message(
+        await save_message(
             user_id=req.user_id,
             message=error_msg,
             is_bot=True,
@@ -77,7 +77,7 @@ async def handle_follow_up_request(req: FollowUpRequest):
         
         # If crop_type or disease not provided, try to get from recent conversation
         if not req.crop_type or not req.disease:
-            analysis_info = follow_up_handler.get_last_analysis_info(req.user_id)
+            analysis_info = await follow_up_handler.get_last_analysis_info(req.user_id)
             crop_type = req.crop_type or analysis_info.get("crop_type", "")
             disease = req.disease or analysis_info.get("disease", "")
         else:
@@ -85,7 +85,7 @@ async def handle_follow_up_request(req: FollowUpRequest):
             disease = req.disease
         
         # Generate response using follow-up handler
-        response = follow_up_handler.generate_response(
+        response = await follow_up_handler.generate_response(
             intent=req.intent,
             crop_type=crop_type,
             disease=disease,
@@ -93,13 +93,13 @@ async def handle_follow_up_request(req: FollowUpRequest):
         )
         
         # Save interaction to database
-        save_message(
+        await save_message(
             user_id=req.user_id,
             message=f"Follow-up request: {req.intent} for {crop_type}",
             is_bot=False,
             crop_type=crop_type
         )
-        save_message(
+        await save_message(
             user_id=req.user_id,
             message=response,
             is_bot=True,
@@ -107,7 +107,7 @@ async def handle_follow_up_request(req: FollowUpRequest):
         )
         
         # Get session info
-        session_info = get_user_session_info(req.user_id)
+        session_info = await get_user_session_info(req.user_id)
         
         return {
             "user_id": req.user_id,
@@ -205,7 +205,7 @@ async def test_follow_up_detection(user_id: str, message: str):
     """
     try:
         # Test detection
-        should_handle, detected_intent = follow_up_handler.should_handle_message(user_id, message)
+        should_handle, detected_intent = await follow_up_handler.should_handle_message(user_id, message)
         
         if not should_handle:
             return {
@@ -216,15 +216,17 @@ async def test_follow_up_detection(user_id: str, message: str):
             }
         
         # Get analysis context
-        analysis_info = follow_up_handler.get_last_analysis_info(user_id)
+        analysis_info = await follow_up_handler.get_last_analysis_info(user_id)
         
         # Generate response
         if detected_intent:
-            response = follow_up_handler.generate_response(
+            response = await follow_up_handler.generate_response(
                 intent=detected_intent,
                 crop_type=analysis_info.get("crop_type", ""),
                 disease=analysis_info.get("disease", ""),
-                user_id=user_id
+                user_id=user_id,
+                language=follow_up_handler.detect_language(message),
+                personalized=follow_up_handler.is_personalized(message)
             )
         else:
             response = "No intent detected"
@@ -1,11 +1,22 @@
 from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+from typing import Dict, List, Optional
+from app.config import settings
 from app.services.mongo_db import get_recent_messages, save_user, save_message
-from app.services.gemini_api import chat_with_gpt, analyze_crop_image, get_user_session_info
+from app.services.gemini_api import chat_with_gpt, stream_chat_with_gpt, analyze_crop_image, get_user_session_info
 from app.services.whatsapp_api import send_whatsapp_message
 from app.services.generate_questions import generate_Questions
 from app.services.follow_up_handler import follow_up_handler
+from app.services.keyword_matcher import match_keywords
+from app.services.message_router import (
+    ROUTE_CHAT, ROUTE_DIRECT_CALL, ROUTE_FOLLOW_UP, ROUTE_PROGRESS, ROUTE_VOICE_BOT_REPLY,
+    VOICE_BOT_HISTORY, RouteDecision, has_voice_bot_prompt, message_router
+)
+from app.services.media_preprocessor import media_preprocessor
+from app.services.webhook_queue import InboundMessage, webhook_queue, track_stage
 from app.utils.helper import extract_phone_number, format_whatsapp_message, download_twilio_media
 import base64
+import time
 
 router = APIRouter()
 
@@ -14,58 +25,20 @@ def check_direct_call_request(message: str) -> bool:
     Check if user is directly requesting a call without any prior voice bot prompt.
     Returns True if user wants to initiate a voice call.
     """
-    message_lower = message.lower().strip()
-    
-    # English call request patterns
-    english_patterns = [
-        'call me', 'call kar', 'call karo', 'call please', 
-        'phone call', 'voice call', 'baat karna chahiye', 
-        'call back', 'ring me', 'phone karo', 'call now'
-    ]
-    
-    # Hindi call request patterns  
-    hindi_patterns = [
-        'कॉल करें', 'कॉल कर', 'कॉल करो', 'फोन करें', 
-        'फोन करो', 'बात करना चाहिए', 'बात करना है',
-        'आवाज़ में बात', 'voice में बात', 'बोल कर बताएं',
-        'कॉल पर बात', 'फोन पर बात', 'call करें', 'call करो'
-    ]
-    
-    # Check for direct call patterns
-    for pattern in english_patterns + hindi_patterns:
-        if pattern in message_lower:
-            return True
-    
-    return False
+    return match_keywords(message).call
 
-def check_voice_bot_request(user_id: str, current_message: str) -> bool:
+async def check_voice_bot_request(user_id: str, current_message: str) -> bool:
     """
     Check if user replied 'yes' to the voice bot question.
     Returns True if the last bot message was voice_bot_msg and user replied yes.
     """
-    # Normalize user response
-    user_response = current_message.lower().strip()
-
-    # Check for positive responses in English and Hindi
-    positive_responses = ['yes', 'y', 'हाँ', 'हां', 'han', 'haan', 'ok', 'okay']
-
-    if user_response not in positive_responses:
+    # Positive responses in English and Hindi (whole message only)
+    if not match_keywords(current_message).affirmative:
         return False
 
     # Get last 5 messages to check conversation context (increased for better detection)
-    recent_messages = get_recent_messages(user_id, limit=5)
-
-    if len(recent_messages) < 2:
-        return False
-
-    # Look for voice bot question in recent messages
-    for msg in reversed(recent_messages):
-        if (msg.get('is_bot', False) and 
-            '🎙️' in msg.get('message', '') and 
-            'KHETI AI EXPERT' in msg.get('message', '')):
-            return True
-
-    return False
+    recent_messages = await get_recent_messages(user_id, limit=VOICE_BOT_HISTORY)
+    return has_voice_bot_prompt(recent_messages)
 
 async def initiate_direct_voice_call(user_id: str, phone_number: str, user_message: str) -> bool:
     """
@@ -83,7 +56,7 @@ async def initiate_direct_voice_call(user_id: str, phone_number: str, user_messa
         )
         
         send_whatsapp_message(phone_number, ack_message)
-        save_message(user_id, ack_message, "", True, "")
+        await save_message(user_id, ack_message, "", True, "", phone_number=phone_number)
         
         # Format phone number for API
         formatted_phone = f"0{phone_number.replace('+91', '').replace('+', '')}"
@@ -92,7 +65,7 @@ async def initiate_direct_voice_call(user_id: str, phone_number: str, user_messa
         api_url = "http://115.112.107.166:8081/api/make_call"
         
         # Get recent conversation context for better voice bot interaction
-        recent_messages = get_recent_messages(user_id, limit=10)
+        recent_messages = await get_recent_messages(user_id, limit=10)
         conversation_context = ""
         
         for msg in recent_messages[-5:]:  # Last 5 messages for context
@@ -156,7 +129,7 @@ Start with: "Namaste! Main aapka KHETI AI EXPERT hun. Aapne call ki request ki t
             )
             
             send_whatsapp_message(phone_number, success_message)
-            save_message(user_id, success_message, "", True, "")
+            await save_message(user_id, success_message, "", True, "", phone_number=phone_number)
             
             return True
         else:
@@ -176,7 +149,7 @@ Start with: "Namaste! Main aapka KHETI AI EXPERT hun. Aapne call ki request ki t
         )
         
         send_whatsapp_message(phone_number, error_message)
-        save_message(user_id, error_message, "", True, "")
+        await save_message(user_id, error_message, "", True, "", phone_number=phone_number)
         
         return False
 
@@ -228,21 +201,23 @@ async def test_voice_bot_api(phone_number: str):
         print(f"❌ Test failed: {str(e)}")
         return False
 
-async def handle_voice_bot_call(user_id: str, phone_number: str, crop_type: str, message: str):
+async def handle_voice_bot_call(user_id: str, phone_number: str, crop_type: str, message: str,
+                                recent_messages: Optional[List[Dict]] = None):
     """
     Handle voice bot API call if user agreed to voice bot assistance.
-    Only calls API if check_voice_bot_request returns True.
+    Only calls API if check_voice_bot_request returns True; callers that already
+    classified the reply pass the recent_messages they read instead.
     """
     import requests
     import asyncio
     
     # Check if this is a positive response to voice bot question
-    if not check_voice_bot_request(user_id, message):
+    if recent_messages is None and not await check_voice_bot_request(user_id, message):
         return False
     
     try:
         # Save user's positive response first
-        save_message(user_id, message, "", False, crop_type)
+        await save_message(user_id, message, "", False, crop_type, phone_number=phone_number)
         
         # Prepare API call data
         api_url = "https://api.ivrsolutions.in/api/dial_by_voicebot"
@@ -252,7 +227,8 @@ async def handle_voice_bot_call(user_id: str, phone_number: str, crop_type: str,
         print(f"Formatted phone number for API: {formatted_phone}")
         
         # Get recent conversation context for the system message
-        recent_messages = get_recent_messages(user_id, limit=5)
+        if recent_messages is None:
+            recent_messages = await get_recent_messages(user_id, limit=VOICE_BOT_HISTORY)
         conversation_context = ""
         
         for msg in recent_messages:
@@ -340,7 +316,7 @@ Start by greeting them and then systematically work through the diagnostic quest
                 "📲 कृपया फोन उठाएं।"
             )
             send_whatsapp_message(phone_number, success_msg)
-            save_message(user_id, success_msg, "", True, crop_type)
+            await save_message(user_id, success_msg, "", True, crop_type, phone_number=phone_number)
             
             return True
             
@@ -359,7 +335,7 @@ Start by greeting them and then systematically work through the diagnostic quest
                 error_msg = f"❌ Voice-Bot call mein problem (Code: {response.status_code}): {error_message}"
             
             send_whatsapp_message(phone_number, error_msg)
-            save_message(user_id, error_msg, "", True, crop_type)
+            await save_message(user_id, error_msg, "", True, crop_type, phone_number=phone_number)
             
             # Offer alternative support
             fallback_msg = (
@@ -371,26 +347,26 @@ Start by greeting them and then systematically work through the diagnostic quest
                 "I can help you via text as well."
             )
             send_whatsapp_message(phone_number, fallback_msg)
-            save_message(user_id, fallback_msg, "", True, crop_type)
+            await save_message(user_id, fallback_msg, "", True, crop_type, phone_number=phone_number)
             
             return False
             
     except requests.exceptions.Timeout:
         timeout_msg = "❌ Voice-Bot service mein delay. Thodi der baad try kariye."
         send_whatsapp_message(phone_number, timeout_msg)
-        save_message(user_id, timeout_msg, "", True, crop_type)
+        await save_message(user_id, timeout_msg, "", True, crop_type, phone_number=phone_number)
         return False
         
     except requests.exceptions.RequestException as e:
         network_msg = f"❌ Network problem: {str(e)[:100]}"
         send_whatsapp_message(phone_number, network_msg)
-        save_message(user_id, network_msg, "", True, crop_type)
+        await save_message(user_id, network_msg, "", True, crop_type, phone_number=phone_number)
         return False
         
     except Exception as e:
         error_msg = f"❌ Voice-Bot call mein technical problem: {str(e)[:100]}"
         send_whatsapp_message(phone_number, error_msg)
-        save_message(user_id, error_msg, "", True, crop_type)
+        await save_message(user_id, error_msg, "", True, crop_type, phone_number=phone_number)
         print(f"Voice bot API error for {phone_number}: {str(e)}")
         return False
 
@@ -400,7 +376,7 @@ async def get_treatment_progress(user_id: str, phone_number: str) -> str:
     """
     try:
         # Get recent messages to find voice call summaries and treatments
-        recent_messages = get_recent_messages(user_id, limit=20)
+        recent_messages = await get_recent_messages(user_id, limit=20)
         
         voice_call_summaries = []
         treatment_messages = []
@@ -621,7 +597,7 @@ CALL DETAILS:
             send_whatsapp_message(phone_number, chunk_with_indicator)
             
             # Save each chunk to database
-            save_message(user_id, chunk, "", True, "voice_call_summary")
+            await save_message(user_id, chunk, "", True, "voice_call_summary", phone_number=phone_number)
         
         print(f"[POST_CALL] Comprehensive summary sent to {phone_number}, duration: {call_duration}s, messages: {len(user_messages)}")
         return True
@@ -645,13 +621,149 @@ CALL DETAILS:
 💚 **हमेशा आपकी सेवा में - KHETI AI Team**"""
 
         send_whatsapp_message(phone_number, fallback_msg)
-        save_message(user_id, fallback_msg, "", True, "voice_call_complete")
+        await save_message(user_id, fallback_msg, "", True, "voice_call_complete", phone_number=phone_number)
         return False
 
+async def route_voice_bot_reply(decision: RouteDecision) -> Optional[dict]:
+    """Farmer said yes to the voice bot question"""
+    voice_bot_handled = await handle_voice_bot_call(
+        decision.user_id, decision.phone_number, "", decision.message,
+        recent_messages=decision.history[:VOICE_BOT_HISTORY]
+    )
+    return {"status": "success"} if voice_bot_handled else None
+
+async def route_direct_call(decision: RouteDecision) -> Optional[dict]:
+    """Farmer asked for a call directly"""
+    # Save user request
+    await save_message(decision.user_id, decision.message, "", False, "", phone_number=decision.phone_number)
+
+    # Trigger immediate voice call without confirmation
+    call_triggered = await initiate_direct_voice_call(decision.user_id, decision.phone_number, decision.message)
+    if call_triggered:
+        return {"status": "success", "action": "direct_call_initiated"}
+    return None
+
+async def route_progress(decision: RouteDecision) -> Optional[dict]:
+    """Farmer asked for a treatment progress update"""
+    # Get recent call summaries and provide progress tracking
+    progress_message = await get_treatment_progress(decision.user_id, decision.phone_number)
+    send_whatsapp_message(decision.phone_number, progress_message)
+    await save_message(decision.user_id, progress_message, "", True, "progress_update", phone_number=decision.phone_number)
+    return {"status": "success", "action": "progress_update"}
+
+async def route_follow_up(decision: RouteDecision) -> Optional[dict]:
+    """Follow-up keyword (treatment/prevention/medicine...) after a crop analysis"""
+    user_id, phone_number, message = decision.user_id, decision.phone_number, decision.message
+    analysis_info = decision.analysis_info
+
+    # Generate targeted response
+    follow_up_response = await follow_up_handler.generate_response(
+        intent=decision.intent,
+        crop_type=analysis_info.get("crop_type", ""),
+        disease=analysis_info.get("disease", ""),
+        user_id=user_id,
+        language=follow_up_handler.detect_language(message),
+        personalized=follow_up_handler.is_personalized(message)
+    )
+    
+    # Save user message
+    await save_message(user_id, message, "", False, analysis_info.get("crop_type", ""), phone_number=phone_number)
+    
+    # Send follow-up response in chunks if needed
+    response_chunks = format_whatsapp_message(follow_up_response, max_length=1500)
+    
+    for i, chunk in enumerate(response_chunks):
+        # Save bot response
+        await save_message(user_id, chunk, "", True, analysis_info.get("crop_type", ""), phone_number=phone_number)
+        
+        # Add chunk indicator for multi-part messages
+        if len(response_chunks) > 1:
+            chunk_with_indicator = f"({i+1}/{len(response_chunks)})\n{chunk}"
+        else:
+            chunk_with_indicator = chunk
+        
+        send_whatsapp_message(phone_number, chunk_with_indicator)
+    
+    return {"status": "success", "type": "follow_up", "intent": decision.intent}
+
+async def route_chat(decision: RouteDecision) -> Optional[dict]:
+    """Everything else goes to the AI chat"""
+    user_id, phone_number, message = decision.user_id, decision.phone_number, decision.message
+
+    if settings.STREAM_TEXT_REPLIES:
+        # Send each chunk as soon as the model has written it; the total isn't known yet,
+        # so follow-on chunks are numbered without it
+        started = time.perf_counter()
+
+        def send_chunk(chunk: str, index: int):
+            if index == 0:
+                webhook_queue.record_stage("text_first_chunk", time.perf_counter() - started)
+            send_whatsapp_message(phone_number, chunk if index == 0 else f"({index+1})\n{chunk}")
+
+        with track_stage("text_chat"):
+            reply, crop_type, message_chunks = await stream_chat_with_gpt(
+                message, user_id, send_chunk, max_length=settings.WHATSAPP_CHUNK_LENGTH
+            )
+
+        # Save user message and the reply chunks to database
+        await save_message(user_id, message, "", False, crop_type, phone_number=phone_number)
+        for chunk in message_chunks:
+            await save_message(user_id, chunk, "", True, crop_type, phone_number=phone_number)
+    else:
+        # Get AI response with crop type (includes session management)
+        with track_stage("text_chat"):
+            reply, crop_type = await chat_with_gpt(message, user_id)
+
+        # Save user message to database
+        await save_message(user_id, message, "", False, crop_type, phone_number=phone_number)
+
+        # Format and send response in properly sized chunks
+        message_chunks = format_whatsapp_message(reply, max_length=settings.WHATSAPP_CHUNK_LENGTH)
+        
+        for i, chunk in enumerate(message_chunks):
+            # Save each bot reply chunk to database
+            await save_message(user_id, chunk, "", True, crop_type, phone_number=phone_number)
+            
+            # Add message number indicator for multi-part messages
+            if len(message_chunks) > 1:
+                chunk_indicator = f"({i+1}/{len(message_chunks)})\n{chunk}"
+            else:
+                chunk_indicator = chunk
+                
+            send_whatsapp_message(phone_number, chunk_indicator)
+
+    # Send session info to user if it's a long conversation
+    session_info = await get_user_session_info(user_id)
+    if session_info and session_info.get("message_count", 0) > 20:
+        session_msg = f"💬 Session: {session_info.get('message_count', 0)} messages, {session_info.get('time_remaining', 0)//60:.0f} min remaining"
+        send_whatsapp_message(phone_number, session_msg)
+    
+    # Occasionally suggest voice call feature for complex problems
+    elif session_info and session_info.get("message_count", 0) > 5 and session_info.get("message_count", 0) % 7 == 0:
+        call_hint_msg = (
+            "💡 **Quick Tip**: जटिल समस्याओं के लिए\n"
+            "📞 'call करें' लिखकर Voice Expert से बात करें!\n"
+            "🎙️ तत्काल समाधान + WhatsApp follow-up"
+        )
+        send_whatsapp_message(phone_number, call_hint_msg)
+
+    return {"status": "success"}
+
+# Route name -> handler, dispatched by message_router
+ROUTE_HANDLERS = {
+    ROUTE_VOICE_BOT_REPLY: route_voice_bot_reply,
+    ROUTE_DIRECT_CALL: route_direct_call,
+    ROUTE_PROGRESS: route_progress,
+    ROUTE_FOLLOW_UP: route_follow_up,
+    ROUTE_CHAT: route_chat
+}
+
 @router.post("/webhook")
 async def webhook(req: Request):
     """Enhanced WhatsApp webhook with session management and proper message saving"""
     try:
+        ack_started = time.perf_counter()
+
         # Parse form data
         form = await req.form()
         
@@ -666,153 +778,106 @@ async def webhook(req: Request):
             from_field = str(from_field)
         phone_number = extract_phone_number(from_field)
         media_url = form.get("MediaUrl0")
+        if media_url is not None and not isinstance(media_url, str):
+            media_url = str(media_url)
+        message_sid = form.get("MessageSid", "")
+        if not isinstance(message_sid, str):
+            message_sid = str(message_sid)
         
         if not phone_number:
             return {"status": "error", "message": "No phone number provided"}
 
+        # Acknowledge-then-process: hand the message to the background workers
+        # and return before Twilio's webhook timeout can trigger a retry
+        if settings.WEBHOOK_ASYNC_MODE and webhook_queue.is_running():
+            if webhook_queue.is_duplicate(message_sid):
+                return {"status": "success", "action": "duplicate_ignored"}
+
+            inbound = InboundMessage(
+                phone_number=phone_number,
+                message=message,
+                media_url=media_url,
+                message_sid=message_sid
+            )
+            if not webhook_queue.enqueue(inbound):
+                webhook_queue.forget(message_sid)
+                return JSONResponse(
+                    status_code=503,
+                    content={"status": "error", "message": "Webhook queue is full"},
+                    headers={"Retry-After": "5"}
+                )
+
+            webhook_queue.record_stage("ack", time.perf_counter() - ack_started)
+            return {"status": "accepted", "queue_depth": webhook_queue.depth()}
+
+        return await process_inbound_message(phone_number, message, media_url)
+    
+    except Exception as e:
+        print(f"Webhook error: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+
+async def process_inbound_message(phone_number: str, message: str, media_url: Optional[str] = None):
+    """
+    Handle one inbound WhatsApp message end to end: AI work, DB writes and replies.
+    Runs inline from the webhook or from a background worker in async mode.
+    """
+    try:
         # Use phone number as user_id for WhatsApp users
         user_id = phone_number
         
         # ---------------- TEXT MESSAGE HANDLING WITH SESSION MANAGEMENT ----------------
         if message and not media_url:
             # Save user with phone number
-            save_user(user_id, phone_number, "")
+            await save_user(user_id, phone_number, "")
 
-            # Check if user is responding to voice bot question and handle API call
-            voice_bot_handled = await handle_voice_bot_call(user_id, phone_number, "", message)
-            if voice_bot_handled:
-                return {"status": "success"}
-
-            # Check if user is directly requesting a call (NEW FEATURE)
-            if check_direct_call_request(message):
-                # Save user request
-                save_message(user_id, message, "", False, "")
-                
-                # Trigger immediate voice call without confirmation
-                call_triggered = await initiate_direct_voice_call(user_id, phone_number, message)
-                if call_triggered:
-                    return {"status": "success", "action": "direct_call_initiated"}
-
-            # Check if user is requesting progress update (NEW FEATURE)
-            if message.lower().strip() in ['progress', 'प्रोग्रेस', 'स्टेटस', 'status', 'update', 'हाल']:
-                # Get recent call summaries and provide progress tracking
-                progress_message = await get_treatment_progress(user_id, phone_number)
-                send_whatsapp_message(phone_number, progress_message)
-                save_message(user_id, progress_message, "", True, "progress_update")
-                return {"status": "success", "action": "progress_update"}
-
-            # Check if this is a follow-up message (treatment/prevention/medicine)
-            should_handle_followup, detected_intent = follow_up_handler.should_handle_message(user_id, message)
-            
-            if should_handle_followup and detected_intent:
-                # Get context from recent analysis
-                analysis_info = follow_up_handler.get_last_analysis_info(user_id)
-                
-                # Generate targeted response
-                follow_up_response = follow_up_handler.generate_response(
-                    intent=detected_intent,
-                    crop_type=analysis_info.get("crop_type", ""),
-                    disease=analysis_info.get("disease", ""),
-                    user_id=user_id
-                )
-                
-                # Save user message
-                save_message(user_id, message, "", False, analysis_info.get("crop_type", ""))
-                
-                # Send follow-up response in chunks if needed
-                response_chunks = format_whatsapp_message(follow_up_response, max_length=1500)
-                
-                for i, chunk in enumerate(response_chunks):
-                    # Save bot response
-                    save_message(user_id, chunk, "", True, analysis_info.get("crop_type", ""))
-                    
-                    # Add chunk indicator for multi-part messages
-                    if len(response_chunks) > 1:
-                        chunk_with_indicator = f"({i+1}/{len(response_chunks)})\n{chunk}"
-                    else:
-                        chunk_with_indicator = chunk
-                    
-                    send_whatsapp_message(phone_number, chunk_with_indicator)
-                
-                return {"status": "success", "type": "follow_up", "intent": detected_intent}
-
-            # Get AI response with crop type (includes session management)
-            reply, crop_type = await chat_with_gpt(message, user_id)
-
-            # Save user message to database
-            save_message(user_id, message, "", False, crop_type)
-
-            # Format and send response in properly sized chunks
-            message_chunks = format_whatsapp_message(reply, max_length=1500)
-            
-            for i, chunk in enumerate(message_chunks):
-                # Save each bot reply chunk to database
-                save_message(user_id, chunk, "", True, crop_type)
-                
-                # Add message number indicator for multi-part messages
-                if len(message_chunks) > 1:
-                    chunk_indicator = f"({i+1}/{len(message_chunks)})\n{chunk}"
-                else:
-                    chunk_indicator = chunk
-                    
-                send_whatsapp_message(phone_number, chunk_indicator)
-
-            # Send session info to user if it's a long conversation
-            session_info = get_user_session_info(user_id)
-            if session_info and session_info.get("message_count", 0) > 20:
-                session_msg = f"💬 Session: {session_info.get('message_count', 0)} messages, {session_info.get('time_remaining', 0)//60:.0f} min remaining"
-                send_whatsapp_message(phone_number, session_msg)
-            
-            # Occasionally suggest voice call feature for complex problems
-            elif session_info and session_info.get("message_count", 0) > 5 and session_info.get("message_count", 0) % 7 == 0:
-                call_hint_msg = (
-                    "💡 **Quick Tip**: जटिल समस्याओं के लिए\n"
-                    "📞 'call करें' लिखकर Voice Expert से बात करें!\n"
-                    "🎙️ तत्काल समाधान + WhatsApp follow-up"
-                )
-                send_whatsapp_message(phone_number, call_hint_msg)
+            # Classify once (one keyword pass, at most one history read), then dispatch
+            decision = await message_router.classify(user_id, phone_number, message)
+            return await message_router.dispatch(decision, ROUTE_HANDLERS)
 
         # ---------------- IMAGE MESSAGE HANDLING WITH SESSION MANAGEMENT ----------------
         elif media_url:
             try:
                 # Save user with phone number
-                save_user(user_id, phone_number, "")
+                await save_user(user_id, phone_number, "")
 
                 # Send acknowledgment
                 ack_message = "📸 फोटो मिल गई! समाधान हो रहा है...\n(Image received! Analyzing...)"
                 send_whatsapp_message(phone_number, ack_message)
                 
                 # Save acknowledgment message to database
-                save_message(user_id, ack_message, "", True, "")
+                await save_message(user_id, ack_message, "", True, "", phone_number=phone_number)
 
                 # Download image with improved authentication
                 try:
-                    if not isinstance(media_url, str):
-                        media_url_str = str(media_url)
-                    else:
-                        media_url_str = media_url
-                    image_content = download_twilio_media(media_url_str)
+                    with track_stage("media_download"):
+                        image_content = await download_twilio_media(media_url)
                     print(f"Successfully downloaded image for {phone_number}, size: {len(image_content)} bytes")
                 except Exception as download_error:
                     print(f"Image download error for {phone_number}: {str(download_error)}")
                     raise download_error
 
+                # Downscale and strip EXIF before analysis and storage
+                with track_stage("image_preprocess"):
+                    image_content, _ = await media_preprocessor.process_async(image_content)
+
                 # Convert to base64
                 image_base64 = base64.b64encode(image_content).decode('utf-8')
                 print(f"Image converted to base64 for {phone_number}, length: {len(image_base64)}")
 
                 # Analyze image with context and session management
-                diagnosis, crop_type = await analyze_crop_image(image_base64, user_id)
+                with track_stage("image_analysis"):
+                    diagnosis, crop_type = await analyze_crop_image(image_base64, user_id)
                 
                 # Save image upload to database (store base64 instead of message text)
-                save_message(user_id, "", image_base64, False, crop_type)
+                await save_message(user_id, "", image_base64, False, crop_type, phone_number=phone_number)
                 
                 # Format and send diagnosis in proper chunks
                 diagnosis_chunks = format_whatsapp_message(diagnosis, max_length=1500)
                 
                 for i, chunk in enumerate(diagnosis_chunks):
                     # Save each diagnosis chunk to database
-                    save_message(user_id, chunk, "", True, crop_type)
+                    await save_message(user_id, chunk, "", True, crop_type, phone_number=phone_number)
                     
                     if len(diagnosis_chunks) > 1:
                         chunk_with_indicator = f"📋 Report ({i+1}/{len(diagnosis_chunks)})\n{chunk}"
@@ -866,7 +931,7 @@ async def webhook(req: Request):
                 send_whatsapp_message(phone_number, follow_up_msg)
                 
                 # Save follow-up message to database
-                save_message(user_id, follow_up_msg, "", True, crop_type)
+                await save_message(user_id, follow_up_msg, "", True, crop_type, phone_number=phone_number)
 
                 # Let's ask the farmer for the Voice-Bot assistance
                 voice_bot_msg = (
@@ -874,7 +939,7 @@ async def webhook(req: Request):
                     "अपनी समस्या बताएं, मैं आपकी मदद करूंगा!"
                 )
                 send_whatsapp_message(phone_number, voice_bot_msg)
-                save_message(user_id, voice_bot_msg, "", True, crop_type)
+                await save_message(user_id, voice_bot_msg, "", True, crop_type, phone_number=phone_number)
 
             except Exception as e:
                 error_msg = f"❌ Photo processing mein problem: {str(e)[:100]}..."
@@ -882,7 +947,7 @@ async def webhook(req: Request):
                 send_whatsapp_message(phone_number, error_msg)
                 
                 # Save error message to database
-                save_message(user_id, error_msg, "", True, "")
+                await save_message(user_id, error_msg, "", True, "", phone_number=phone_number)
 
         # If neither text nor image
         else:
@@ -901,13 +966,13 @@ async def webhook(req: Request):
             send_whatsapp_message(phone_number, help_msg)
             
             # Save help message to database
-            save_user(user_id, phone_number, "")
-            save_message(user_id, help_msg, "", True, "")
+            await save_user(user_id, phone_number, "")
+            await save_message(user_id, help_msg, "", True, "", phone_number=phone_number)
 
         return {"status": "success"}
     
     except Exception as e:
-        print(f"Webhook error: {str(e)}")
+        print(f"Webhook processing error for {phone_number}: {str(e)}")
         return {"status": "error", "message": str(e)}
 
 
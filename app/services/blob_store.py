@@ -0,0 +1,144 @@
+"""
+Blob Store Service
+Content-addressed storage for crop images, so message documents only keep a reference.
+Blobs are keyed by their SHA-256 digest and stored once however often they are sent.
+"""
+
+import asyncio
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorGridFSBucket
+
+
+def content_digest(data: bytes) -> str:
+    """SHA-256 hex digest used as the blob reference"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore:
+    """Base class for content-addressed blob backends"""
+
+    backend = "base"
+
+    def __init__(self, known_refs_size: int = 10000):
+        # Digests known to be stored, so repeat uploads skip the existence check
+        self._known_refs: "OrderedDict[str, None]" = OrderedDict()
+        self._known_refs_size = known_refs_size
+        self._stats = {"puts": 0, "deduplicated": 0, "bytes_stored": 0, "gets": 0, "missing": 0}
+
+    async def put(self, data: bytes, content_type: str = "image/jpeg") -> str:
+        """Store data once and return its reference"""
+        ref = content_digest(data)
+        self._stats["puts"] += 1
+
+        if ref in self._known_refs or await self._exists(ref):
+            self._stats["deduplicated"] += 1
+        else:
+            await self._write(ref, data, content_type)
+            self._stats["bytes_stored"] += len(data)
+
+        self._remember(ref)
+        return ref
+
+    async def get(self, ref: str) -> Optional[bytes]:
+        """Load a blob by reference, or None if it is not stored"""
+        self._stats["gets"] += 1
+        data = await self._read(ref)
+        if data is None:
+            self._stats["missing"] += 1
+        return data
+
+    def get_stats(self) -> Dict:
+        """Get backend name and put/dedup counters"""
+        return {"backend": self.backend, **self._stats}
+
+    def _remember(self, ref: str):
+        self._known_refs[ref] = None
+        self._known_refs.move_to_end(ref)
+        if len(self._known_refs) > self._known_refs_size:
+            self._known_refs.popitem(last=False)
+
+    async def _exists(self, ref: str) -> bool:
+        raise NotImplementedError
+
+    async def _write(self, ref: str, data: bytes, content_type: str):
+        raise NotImplementedError
+
+    async def _read(self, ref: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+
+class GridFSBlobStore(BlobStore):
+    """Blobs stored in a GridFS bucket, with the digest as the filename"""
+
+    backend = "gridfs"
+
+    def __init__(self, db: AsyncIOMotorDatabase, bucket_name: str = "images"):
+        super().__init__()
+        self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name=bucket_name)
+
+    async def _exists(self, ref: str) -> bool:
+        cursor = self.bucket.find({"filename": ref}, limit=1)
+        return bool(await cursor.to_list(length=1))
+
+    async def _write(self, ref: str, data: bytes, content_type: str):
+        await self.bucket.upload_from_stream(ref, data, metadata={"content_type": content_type})
+
+    async def _read(self, ref: str) -> Optional[bytes]:
+        try:
+            stream = await self.bucket.open_download_stream_by_name(ref)
+        except Exception:
+            return None
+        return await stream.read()
+
+
+class LocalBlobStore(BlobStore):
+    """Blobs stored as files under a directory, sharded by digest prefix"""
+
+    backend = "local"
+
+    def __init__(self, root: str):
+        super().__init__()
+        self.root = root
+
+    def _path(self, ref: str) -> str:
+        return os.path.join(self.root, ref[:2], ref)
+
+    async def _exists(self, ref: str) -> bool:
+        return os.path.exists(self._path(ref))
+
+    async def _write(self, ref: str, data: bytes, content_type: str):
+        await asyncio.to_thread(self._write_file, self._path(ref), data)
+
+    async def _read(self, ref: str) -> Optional[bytes]:
+        path = self._path(ref)
+        if not os.path.exists(path):
+            return None
+        return await asyncio.to_thread(self._read_file, path)
+
+    @staticmethod
+    def _write_file(path: str, data: bytes):
+        # Write to a temp file and rename so readers never see a partial blob
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read_file(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+
+def create_blob_store(backend: str, db: AsyncIOMotorDatabase, path: str) -> BlobStore:
+    """Create the configured blob store backend ("gridfs" or "local")"""
+    if backend == "local":
+        return LocalBlobStore(path)
+    if backend == "gridfs":
+        return GridFSBlobStore(db)
+    raise ValueError(f"Unknown blob store backend: {backend}")
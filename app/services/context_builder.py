@@ -0,0 +1,116 @@
+"""
+Context Builder Service
+Assembles the conversation history sent to GPT-4o against a token budget.
+Earlier photos are replaced by the diagnosis they received, and the oldest turns
+are dropped once the budget is spent, so long chats don't resend megabytes of images.
+"""
+
+import re
+from typing import Dict, List, Tuple
+
+from app.services.prompts import estimate_message_tokens
+
+# Lines of a diagnosis worth keeping when it stands in for the photo
+DIAGNOSIS_LINE_PATTERN = re.compile(r"CROP_TYPE|रोग|Disease|फसल", re.IGNORECASE)
+DIAGNOSIS_MAX_CHARS = 240
+
+
+def _diagnosis_excerpt(reply: str) -> str:
+    """Pull the crop/disease lines out of an earlier image diagnosis"""
+    lines = [line.strip() for line in reply.splitlines() if DIAGNOSIS_LINE_PATTERN.search(line)]
+    excerpt = " | ".join(lines) if lines else reply.strip()
+    return excerpt[:DIAGNOSIS_MAX_CHARS]
+
+
+class ContextBuilder:
+    """
+    Builds [system, summary, ...history, current turn] within a token budget.
+    The system prompt and the current turn are always kept; history is filled newest-first.
+    """
+
+    def __init__(self, token_budget: int = 6000):
+        self.token_budget = token_budget
+        self._stats = {
+            "builds": 0, "tokens_full": 0, "tokens_sent": 0,
+            "images_replaced": 0, "messages_dropped": 0
+        }
+
+    def build(self, system_prompt: str, messages: List, summary: str = "") -> Tuple[List[Dict], Dict]:
+        """
+        Return the OpenAI messages to send and a report of what was trimmed.
+        `messages` are session Message objects; their OpenAI forms and token estimates are cached.
+        """
+        # The running summary follows the static system prompt so the prompt's cacheable prefix is unchanged
+        prefix = [{"role": "system", "content": system_prompt}]
+        if summary:
+            prefix.append({"role": "system", "content": f"Conversation summary so far:\n{summary}"})
+        prefix_tokens = sum(estimate_message_tokens(m) for m in prefix)
+        tokens_full = prefix_tokens + sum(m.token_estimate for m in messages)
+
+        if not messages:
+            return prefix, self._record(tokens_full, tokens_full, 0, 0)
+
+        history, current = messages[:-1], messages[-1]
+        current_form = current.to_openai_format()
+        current_tokens = estimate_message_tokens(current_form)
+        remaining = self.token_budget - prefix_tokens - current_tokens
+
+        # Walk newest-first; earlier photos were already diagnosed, so send the diagnosis text instead
+        kept: List[Tuple[Dict, int]] = []
+        images_replaced = 0
+        for index in range(len(history) - 1, -1, -1):
+            message = history[index]
+            if message.image_ref:
+                following = history[index + 1] if index + 1 < len(history) else None
+                if following is not None and following.role == "assistant":
+                    note = f"[Crop photo sent earlier. Diagnosis: {_diagnosis_excerpt(following.content)}]"
+                else:
+                    note = "[Crop photo sent earlier]"
+                form = {"role": "user", "content": note}
+                cost = estimate_message_tokens(form)
+            else:
+                form = message.to_openai_format()
+                cost = message.token_estimate
+            if cost > remaining:
+                break
+            if message.image_ref:
+                images_replaced += 1
+            kept.append((form, cost))
+            remaining -= cost
+        kept.reverse()
+
+        # Don't open the history with a reply whose question was dropped
+        while kept and kept[0][0].get("role") == "assistant":
+            kept.pop(0)
+
+        # Photos in dropped turns never reach the request either
+        images_replaced += sum(1 for message in history[:len(history) - len(kept)] if message.image_ref)
+        built = prefix + [form for form, _ in kept] + [current_form]
+        tokens_sent = prefix_tokens + sum(cost for _, cost in kept) + current_tokens
+        return built, self._record(tokens_full, tokens_sent, images_replaced, len(history) - len(kept))
+
+    def _record(self, tokens_full: int, tokens_sent: int, images_replaced: int, messages_dropped: int) -> Dict:
+        self._stats["builds"] += 1
+        self._stats["tokens_full"] += tokens_full
+        self._stats["tokens_sent"] += tokens_sent
+        self._stats["images_replaced"] += images_replaced
+        self._stats["messages_dropped"] += messages_dropped
+        return {
+            "tokens_full": tokens_full,
+            "tokens_sent": tokens_sent,
+            "tokens_saved": tokens_full - tokens_sent,
+            "images_replaced": images_replaced,
+            "messages_dropped": messages_dropped
+        }
+
+    def get_stats(self) -> Dict:
+        """Get totals of tokens sent versus the untrimmed history"""
+        builds = self._stats["builds"]
+        tokens_saved = self._stats["tokens_full"] - self._stats["tokens_sent"]
+        return {
+            "token_budget": self.token_budget,
+            **self._stats,
+            "tokens_saved": tokens_saved,
+            "avg_tokens_saved": tokens_saved // builds if builds else 0,
+            "savings_ratio": round(tokens_saved / self._stats["tokens_full"], 3) if self._stats["tokens_full"] else 0.0
+        }
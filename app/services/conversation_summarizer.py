@@ -0,0 +1,133 @@
+"""
+Conversation Summarizer Service
+Folds the older turns of long sessions into a running summary stored on the session.
+Runs as a background task after a reply is produced, never on the request path.
+"""
+
+import asyncio
+import time
+from typing import Dict, List, Set
+
+from app.config import settings
+from app.services.prompts import CONVERSATION_SUMMARY_PROMPT
+from app.services.session_manager import Message, ROLE_USER, session_manager
+
+# Cap on each turn's text inside the summarization request
+TURN_MAX_CHARS = 600
+
+
+def _render_turns(messages: List[Message]) -> str:
+    """Plain-text transcript of the turns being folded in"""
+    lines = []
+    for msg in messages:
+        speaker = "Farmer" if msg.role is ROLE_USER else "AgriBot"
+        text = msg.content.strip()
+        if msg.image_ref:
+            text = f"[sent a crop photo] {text}".strip()
+        lines.append(f"{speaker}: {text[:TURN_MAX_CHARS]}")
+    return "\n".join(lines)
+
+
+class ConversationSummarizer:
+    """
+    Once a session holds more than trigger_messages live messages, everything but the
+    newest keep_recent is summarized together with the previous summary and dropped.
+    At most one summarization runs per user at a time.
+    """
+
+    def __init__(self, trigger_messages: int = 20, keep_recent: int = 8, max_tokens: int = 300, enabled: bool = True):
+        self.trigger_messages = trigger_messages
+        self.keep_recent = keep_recent
+        self.max_tokens = max_tokens
+        self.enabled = enabled
+        self._in_flight: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._stats = {"runs": 0, "failed": 0, "messages_folded": 0, "seconds": 0.0}
+
+    def maybe_schedule(self, session):
+        """Start a background summarization if the session just written has grown past the trigger"""
+        if not self.enabled or session is None:
+            return
+        user_id = session.user_id
+        if not user_id or user_id in self._in_flight or len(session.messages) <= self.trigger_messages:
+            return
+
+        self._in_flight.add(user_id)
+        task = asyncio.create_task(self._summarize(user_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def stop(self):
+        """Cancel summarizations still running (called on app shutdown)"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _summarize(self, user_id: str):
+        # Imported here: gemini_api schedules summaries, so a module-level import would be circular
+        from app.services.gemini_api import create_chat_completion
+
+        started = time.perf_counter()
+        try:
+            session = await session_manager.get_session(user_id)
+            if session is None:
+                return
+            to_fold = session.get_messages_to_summarize(self.keep_recent)
+            if not to_fold:
+                return
+
+            request = (
+                f"Previous summary:\n{session.summary or '(none)'}\n\n"
+                f"New turns:\n{_render_turns(to_fold)}"
+            )
+            response = await create_chat_completion(
+                prompt_name=CONVERSATION_SUMMARY_PROMPT.name,
+                model="gpt-4o",
+                messages=[
+                    {"role": "system", "content": CONVERSATION_SUMMARY_PROMPT.text},
+                    {"role": "user", "content": request}
+                ],
+                temperature=0.2,
+                max_tokens=self.max_tokens
+            )
+            content = response.choices[0].message.content
+            summary = content.strip() if content else ""
+            if not summary:
+                return
+
+            if not await session_manager.apply_summary(user_id, summary, to_fold[-1].seq):
+                return
+            elapsed = time.perf_counter() - started
+            self._stats["runs"] += 1
+            self._stats["messages_folded"] += len(to_fold)
+            self._stats["seconds"] += elapsed
+            print(f"[SUMMARIZER] Folded {len(to_fold)} messages for {user_id} in {elapsed * 1000:.0f}ms")
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._stats["failed"] += 1
+            print(f"[SUMMARIZER] Summarization failed for {user_id}: {e}")
+        finally:
+            self._in_flight.discard(user_id)
+
+    def get_stats(self) -> Dict:
+        """Get summarization counts and latency"""
+        runs = self._stats["runs"]
+        return {
+            "enabled": self.enabled,
+            "trigger_messages": self.trigger_messages,
+            "keep_recent": self.keep_recent,
+            "in_flight": len(self._in_flight),
+            **self._stats,
+            "avg_ms": round(self._stats["seconds"] / runs * 1000, 2) if runs else 0.0
+        }
+
+
+# Global conversation summarizer instance
+conversation_summarizer = ConversationSummarizer(
+    trigger_messages=settings.SUMMARY_TRIGGER_MESSAGES,
+    keep_recent=settings.SUMMARY_KEEP_RECENT,
+    max_tokens=settings.SUMMARY_MAX_TOKENS,
+    enabled=settings.SUMMARY_ENABLED
+)
@@ -5,8 +5,21 @@ Handles keyword detection and response generation for post-analysis follow-up me
 
 import re
 from typing import Dict, List, Tuple, Optional
+from app.config import settings
 from app.services.mongo_db import get_recent_messages
 from app.services.gemini_api import get_treatment_followup
+from app.services.keyword_matcher import INTENT_KEYWORDS, match_keywords
+from app.services.prompts import TREATMENT_FOLLOWUP_PROMPT
+from app.services.response_cache import response_cache
+from app.services.session_manager import add_user_message, add_assistant_message
+
+# Intents whose answers depend only on crop, disease and language, so they can be cached
+CACHEABLE_INTENTS = ("treatment", "prevention", "medicine")
+
+# Bump when response_templates change so cached answers built from old templates are retired
+RESPONSE_TEMPLATES_VERSION = "v1"
+
+DEVANAGARI_PATTERN = re.compile(r"[\u0900-\u097F]")
 
 class FollowUpHandler:
     """
@@ -14,41 +27,8 @@ class FollowUpHandler:
     """
     
     def __init__(self):
-        # Define keyword mappings for different intents (8 categories)
-        self.intent_keywords = {
-            "treatment": {
-                "english": ["treatment", "detailed solution", "treat", "cure", "remedy", "fix", "heal", "solution"],
-                "hindi": ["उपचार", "इलाज", "समाधान", "चिकित्सा", "उपाय"]
-            },
-            "prevention": {
-                "english": ["prevention", "protection", "prevent", "avoid", "stop", "protect", "precaution", "safety"],
-                "hindi": ["रोकथाम", "बचाव", "सुरक्षा", "बचना", "रोकना", "सावधानी"]
-            },
-            "medicine": {
-                "english": ["medicine", "pesticide", "medication", "drug", "spray", "fungicide", "chemical", "insecticide"],
-                "hindi": ["दवा", "कीटनाशक", "दवाई", "छिड़काव", "रसायन", "केमिकल", "स्प्रे"]
-            },
-            "dosage": {
-                "english": ["dosage", "quantity", "amount", "dose", "measurement", "calculation"],
-                "hindi": ["खुराक", "मात्रा", "डोज", "नाप", "परिमाण"]
-            },
-            "cost": {
-                "english": ["cost", "budget", "price", "expense", "money", "rate", "charges"],
-                "hindi": ["कीमत", "लागत", "खर्च", "दाम", "रेट", "पैसा"]
-            },
-            "management": {
-                "english": ["management", "care", "farming", "cultivation", "maintenance", "handling"],
-                "hindi": ["प्रबंधन", "देखभाल", "खेती", "रखरखाव", "संभाल"]
-            },
-            "timing": {
-                "english": ["timing", "calendar", "schedule", "time", "when", "period", "duration"],
-                "hindi": ["समय", "कैलेंडर", "टाइमिंग", "कब", "अवधि", "समयसारणी"]
-            },
-            "emergency": {
-                "english": ["urgent", "emergency", "immediate", "asap", "critical", "serious", "help"],
-                "hindi": ["तुरंत", "आपातकाल", "जरूरी", "गंभीर", "मदद", "इमरजेंसी"]
-            }
-        }
+        # Keyword tables live in keyword_matcher, compiled into one shared automaton
+        self.intent_keywords = INTENT_KEYWORDS
         
         # Define response templates for all 8 categories
         self.response_templates = {
@@ -158,13 +138,16 @@ class FollowUpHandler:
             }
         }
 
-    def detect_follow_up_context(self, user_id: str, limit: int = 10) -> bool:
+    async def detect_follow_up_context(self, user_id: str, limit: int = 10) -> bool:
         """
         Check if user recently received follow-up options after crop analysis.
         Returns True if follow_up_msg was sent in recent conversation.
         """
-        recent_messages = get_recent_messages(user_id, limit=limit)
-        
+        recent_messages = await get_recent_messages(user_id, limit=limit)
+        return self.has_follow_up_context(recent_messages)
+
+    def has_follow_up_context(self, recent_messages: List[Dict]) -> bool:
+        """Check already-fetched recent messages for the follow-up options"""
         for msg in reversed(recent_messages):
             if (msg.get('is_bot', False) and 
                 ('🎯 **[translate:और भी जानकारी चाहिए' in msg.get('message', '') or
@@ -179,59 +162,107 @@ class FollowUpHandler:
         Detect user intent from message based on keywords.
         Returns: 'treatment', 'prevention', 'medicine', or None
         """
-        message_lower = message.lower().strip()
-        
-        # Check each intent
-        for intent, keywords in self.intent_keywords.items():
-            # Check English keywords
-            for keyword in keywords["english"]:
-                if keyword in message_lower:
-                    return intent
-            
-            # Check Hindi keywords
-            for keyword in keywords["hindi"]:
-                if keyword in message_lower:
-                    return intent
-        
-        return None
+        return match_keywords(message).intent
+
+    def detect_language(self, message: str) -> str:
+        """'hi' for messages written in Devanagari, otherwise 'en'"""
+        return "hi" if DEVANAGARI_PATTERN.search(message or "") else "en"
 
-    def generate_response(self, intent: str, crop_type: str = "", disease: str = "", user_id: str = "") -> str:
+    def is_personalized(self, message: str) -> bool:
+        """
+        A follow-up that says more than a keyword or two ("उपचार", "detailed solution")
+        carries the farmer's own situation and should not get a shared cached answer.
+        """
+        return len((message or "").split()) > settings.RESPONSE_CACHE_MAX_GENERIC_WORDS
+
+    async def generate_response(self, intent: str, crop_type: str = "", disease: str = "", user_id: str = "",
+                                language: str = "hi", personalized: bool = False) -> str:
         """
         Generate appropriate response based on detected intent.
+        Treatment, prevention and medicine answers are served from the response cache
+        unless the turn is personalized. A treatment answer that may be shared is generated
+        without the farmer's history, and only its AI part is cached.
         """
         if intent not in self.response_templates:
             return self._get_fallback_response()
         
+        cache_key = None
+        if intent in CACHEABLE_INTENTS and response_cache.enabled:
+            if personalized:
+                response_cache.record_bypass()
+            else:
+                cache_key = response_cache.make_key(intent, crop_type, disease, language, self._response_version(intent))
+                cached = response_cache.get(cache_key)
+                if cached is not None:
+                    if intent != "treatment":
+                        return cached
+                    if crop_type and user_id:
+                        await self._record_treatment_turn(user_id, crop_type, disease, cached)
+                    return self._wrap_response(intent, cached)
+        
+        response, detail, cacheable = await self._build_response(
+            intent, crop_type, disease, user_id, shared=cache_key is not None
+        )
+        if cache_key is not None and cacheable:
+            response_cache.put(cache_key, detail if intent == "treatment" else response)
+        return response
+
+    def _response_version(self, intent: str) -> str:
+        """Cache version for an intent: the template version, plus the prompt version for AI answers"""
+        if intent == "treatment":
+            return f"{RESPONSE_TEMPLATES_VERSION}/{TREATMENT_FOLLOWUP_PROMPT.key}"
+        return RESPONSE_TEMPLATES_VERSION
+
+    async def _record_treatment_turn(self, user_id: str, crop_type: str, disease: str, answer: str):
+        """Keep the session in step with what get_treatment_followup records: the request and the AI answer"""
+        await add_user_message(user_id, f"Tell me more about treatment for {disease} in {crop_type}")
+        await add_assistant_message(user_id, answer)
+
+    def _wrap_response(self, intent: str, detail: str) -> str:
+        """Template intro, the detailed part and the footer"""
+        return self.response_templates[intent]["intro"] + detail + self._get_response_footer(intent)
+
+    async def _build_response(self, intent: str, crop_type: str, disease: str, user_id: str,
+                              shared: bool = False) -> Tuple[str, str, bool]:
+        """
+        Build a response from the templates; returns (response, detailed part, cacheable), where
+        cacheable is False if the AI part failed. With shared set, the treatment answer is generated
+        without the farmer's history (it may be sent to other farmers) and the turn is recorded separately.
+        """
         template = self.response_templates[intent]
-        response = template["intro"]
+        detail = ""
+        cacheable = True
         
         # Handle detailed AI-powered responses
         if template.get("detailed_request") and crop_type and user_id:
             try:
                 if intent == "treatment":
                     # Use existing Gemini API for detailed treatment
-                    detailed_info = get_treatment_followup(disease, crop_type, user_id)
-                    response += detailed_info
+                    if shared:
+                        detail = await get_treatment_followup(disease, crop_type)
+                        await self._record_treatment_turn(user_id, crop_type, disease, detail)
+                    else:
+                        detail = await get_treatment_followup(disease, crop_type, user_id)
+                    # get_treatment_followup reports failures as a "⚠️ ..." message
+                    cacheable = not detail.startswith("⚠️")
                 elif intent == "dosage":
                     # Generate dosage calculator response
-                    response += self._generate_dosage_calculator(crop_type, disease)
+                    detail = self._generate_dosage_calculator(crop_type, disease)
                 elif intent == "timing":
                     # Generate detailed timing schedule
-                    response += self._generate_timing_schedule(crop_type, disease)
+                    detail = self._generate_timing_schedule(crop_type, disease)
                 else:
-                    response += self._get_detailed_fallback(intent, crop_type)
+                    detail = self._get_detailed_fallback(intent, crop_type)
             except Exception as e:
-                response += self._get_detailed_fallback(intent, crop_type)
+                detail = self._get_detailed_fallback(intent, crop_type)
+                cacheable = False
         
         # Handle predefined content responses
         elif "content" in template:
-            for item in template["content"]:
-                response += f"{item}\n"
+            detail = "".join(f"{item}\n" for item in template["content"])
         
         # Add general helpful footer
-        response += self._get_response_footer(intent)
-        
-        return response
+        return self._wrap_response(intent, detail), detail, cacheable
 
     def _get_treatment_fallback(self, crop_type: str) -> str:
         """Fallback treatment response if AI fails."""
@@ -319,13 +350,13 @@ class FollowUpHandler:
             "📞 **[translate:व्यक्तिगत सहायता]**: +91 85188 00080"
         )
 
-    def should_handle_message(self, user_id: str, message: str) -> Tuple[bool, Optional[str]]:
+    async def should_handle_message(self, user_id: str, message: str) -> Tuple[bool, Optional[str]]:
         """
         Determine if this message should be handled as a follow-up.
         Returns: (should_handle, detected_intent)
         """
         # Check if user is in follow-up context
-        if not self.detect_follow_up_context(user_id):
+        if not await self.detect_follow_up_context(user_id):
             return False, None
         
         # Detect intent
@@ -333,13 +364,16 @@ class FollowUpHandler:
         
         return intent is not None, intent
 
-    def get_last_analysis_info(self, user_id: str) -> Dict[str, str]:
+    async def get_last_analysis_info(self, user_id: str) -> Dict[str, str]:
         """
         Get information about the last crop analysis for context.
         Returns dict with crop_type and disease info.
         """
-        recent_messages = get_recent_messages(user_id, limit=15)
-        
+        recent_messages = await get_recent_messages(user_id, limit=15)
+        return self.analysis_info_from_messages(recent_messages)
+
+    def analysis_info_from_messages(self, recent_messages: List[Dict]) -> Dict[str, str]:
+        """Extract crop_type and disease from already-fetched recent messages"""
         crop_type = ""
         disease = ""
         
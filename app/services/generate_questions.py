@@ -14,7 +14,7 @@ async def generate_Questions(user_id: str):
     """
     try:
         # Get the conversation history (60 messages)
-        conversation_data = get_recent_messages(user_id, limit=60)
+        conversation_data = await get_recent_messages(user_id, limit=60)
         
         if not conversation_data:
             # Return basic questions if no conversation history
@@ -240,7 +240,7 @@ def format_conversation(conversation_data):
             formatted_lines.append(f"[{timestamp}] {role}: {message_text}")
         
         # Note if image was shared
-        if msg.get('image_base64'):
+        if msg.get('image_ref') or msg.get('image_base64'):
             formatted_lines.append(f"[{timestamp}] Farmer: [Shared crop image]")
     
     return '\n'.join(formatted_lines)
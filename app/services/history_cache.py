@@ -0,0 +1,92 @@
+"""
+History Cache Service
+Per-user read-through cache of recent message history, shared by every
+history lookup made while handling one inbound message.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+class CachedHistory:
+    """Recent messages for one user, newest first"""
+
+    __slots__ = ("messages", "fetched_limit", "fetched_at")
+
+    def __init__(self, messages: List[Dict], fetched_limit: int):
+        self.messages = messages
+        self.fetched_limit = fetched_limit
+        self.fetched_at = time.monotonic()
+
+    def covers(self, limit: int) -> bool:
+        """True if this entry can answer a query for `limit` messages"""
+        # A short result means the user's whole history is already cached
+        return limit <= self.fetched_limit or len(self.messages) < self.fetched_limit
+
+
+class HistoryCache:
+    """
+    LRU cache of recent messages per user with TTL expiry.
+    Entries are invalidated whenever a message is saved for that user.
+
+    Writes are stamped with a global clock so a read that overlaps a write is not cached.
+    Only the latest max_users stamps are kept; a user whose stamp was evicted is treated
+    as written at the newest evicted stamp, which can only make put() more cautious.
+    """
+
+    def __init__(self, depth: int = 20, ttl: float = 60.0, max_users: int = 10000):
+        self.depth = depth
+        self.ttl = ttl
+        self.max_users = max_users
+        self._entries: "OrderedDict[str, CachedHistory]" = OrderedDict()
+        self._clock = 0
+        self._written_at: "OrderedDict[str, int]" = OrderedDict()
+        self._evicted_clock = 0
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, user_id: str, limit: int) -> Optional[List[Dict]]:
+        """Return up to `limit` cached messages, or None on a miss"""
+        entry = self._entries.get(user_id)
+        if entry is None or time.monotonic() - entry.fetched_at > self.ttl or not entry.covers(limit):
+            self._stats["misses"] += 1
+            return None
+
+        self._entries.move_to_end(user_id)
+        self._stats["hits"] += 1
+        return entry.messages[:limit]
+
+    def generation(self, user_id: str) -> int:
+        """Current write generation; capture it before reading a user's history from the DB"""
+        return self._clock
+
+    def put(self, user_id: str, messages: List[Dict], fetched_limit: int, generation: int):
+        """Store fetched history unless a write happened while it was being read"""
+        if self._written_at.get(user_id, self._evicted_clock) > generation:
+            return
+
+        self._entries[user_id] = CachedHistory(messages, fetched_limit)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        """Drop a user's cached history after a new message is saved"""
+        self._clock += 1
+        self._written_at[user_id] = self._clock
+        self._written_at.move_to_end(user_id)
+        while len(self._written_at) > self.max_users:
+            _, self._evicted_clock = self._written_at.popitem(last=False)
+        if self._entries.pop(user_id, None) is not None:
+            self._stats["invalidations"] += 1
+
+    def get_stats(self) -> Dict:
+        """Get cache size and hit/miss counters"""
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            "cached_users": len(self._entries),
+            "depth": self.depth,
+            "ttl_seconds": self.ttl,
+            **self._stats,
+            "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else 0.0
+        }
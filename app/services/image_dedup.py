@@ -0,0 +1,153 @@
+"""
+Image Dedup Service
+Perceptual-hash index of analyzed crop photos. A resent or forwarded photo (even recompressed
+or slightly resized) hashes to within a few bits of the original, so its stored diagnosis is
+returned instead of paying for another GPT-4o vision call.
+"""
+
+import asyncio
+import io
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from app.config import settings
+
+HASH_BITS = 64
+
+
+def difference_hash(data: bytes) -> int:
+    """64-bit dHash: sign of the horizontal gradient on a 9x8 grayscale thumbnail"""
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft("L", (64, 64))
+        pixels = list(image.convert("L").resize((9, 8), Image.Resampling.LANCZOS).getdata())
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+class DedupEntry:
+    """A stored diagnosis for one perceptual hash"""
+
+    __slots__ = ("image_hash", "diagnosis", "crop_type", "analysis_seconds", "stored_at")
+
+    def __init__(self, image_hash: int, diagnosis: str, crop_type: str, analysis_seconds: float):
+        self.image_hash = image_hash
+        self.diagnosis = diagnosis
+        self.crop_type = crop_type
+        self.analysis_seconds = analysis_seconds
+        self.stored_at = time.monotonic()
+
+
+class ImageDedupIndex:
+    """
+    Near-duplicate lookup within max_distance bits (Hamming).
+    The hash is split into max_distance + 1 bands; by the pigeonhole principle a match within
+    max_distance agrees exactly on at least one band, so each lookup only compares the
+    entries sharing a band instead of scanning the whole index.
+    """
+
+    def __init__(self, max_distance: int = 4, ttl: float = 259200.0, max_entries: int = 10000, enabled: bool = True):
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        band_count = max_distance + 1
+        band_width = -(-HASH_BITS // band_count)
+        self._bands: List[Tuple[int, int]] = [
+            (shift, (1 << min(band_width, HASH_BITS - shift)) - 1)
+            for shift in range(0, HASH_BITS, band_width)
+        ]
+        self._entries: "OrderedDict[int, DedupEntry]" = OrderedDict()
+        self._band_index: List[Dict[int, set]] = [{} for _ in self._bands]
+        self._stats = {"hits": 0, "misses": 0, "stored": 0, "hash_failures": 0, "seconds_saved": 0.0}
+
+    async def compute_hash(self, data: bytes) -> Optional[int]:
+        """Hash image bytes in a worker thread; None if the image cannot be decoded"""
+        try:
+            return await asyncio.to_thread(difference_hash, data)
+        except Exception as e:
+            self._stats["hash_failures"] += 1
+            print(f"[IMAGE_DEDUP] Could not hash image: {e}")
+            return None
+
+    def lookup(self, image_hash: int) -> Optional[DedupEntry]:
+        """Closest stored diagnosis within max_distance, or None"""
+        now = time.monotonic()
+        best, best_distance = None, self.max_distance + 1
+        candidates = set()
+        for band, (shift, mask) in enumerate(self._bands):
+            candidates |= self._band_index[band].get((image_hash >> shift) & mask, set())
+
+        for candidate in candidates:
+            entry = self._entries.get(candidate)
+            if entry is None:
+                continue
+            if now - entry.stored_at > self.ttl:
+                self._remove(candidate)
+                continue
+            distance = (candidate ^ image_hash).bit_count()
+            if distance < best_distance:
+                best, best_distance = entry, distance
+
+        if best is None:
+            self._stats["misses"] += 1
+            return None
+
+        self._entries.move_to_end(best.image_hash)
+        self._stats["hits"] += 1
+        self._stats["seconds_saved"] += best.analysis_seconds
+        print(f"[IMAGE_DEDUP] Near-duplicate photo (distance {best_distance}), "
+              f"saved ~{best.analysis_seconds * 1000:.0f}ms of analysis")
+        return best
+
+    def add(self, image_hash: int, diagnosis: str, crop_type: str, analysis_seconds: float):
+        """Store a diagnosis for a photo's hash"""
+        if image_hash in self._entries:
+            self._remove(image_hash)
+        self._entries[image_hash] = DedupEntry(image_hash, diagnosis, crop_type, analysis_seconds)
+        for band, (shift, mask) in enumerate(self._bands):
+            self._band_index[band].setdefault((image_hash >> shift) & mask, set()).add(image_hash)
+        self._stats["stored"] += 1
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, image_hash: int):
+        if self._entries.pop(image_hash, None) is None:
+            return
+        for band, (shift, mask) in enumerate(self._bands):
+            key = (image_hash >> shift) & mask
+            bucket = self._band_index[band].get(key)
+            if bucket is not None:
+                bucket.discard(image_hash)
+                if not bucket:
+                    del self._band_index[band][key]
+
+    def get_stats(self) -> Dict:
+        """Get hit/miss counters and analysis time saved"""
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            "enabled": self.enabled,
+            "max_distance": self.max_distance,
+            "entries": len(self._entries),
+            **self._stats,
+            "seconds_saved": round(self._stats["seconds_saved"], 2),
+            "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else 0.0
+        }
+
+
+# Global image dedup index
+image_dedup = ImageDedupIndex(
+    max_distance=settings.IMAGE_DEDUP_MAX_DISTANCE,
+    ttl=settings.IMAGE_DEDUP_TTL,
+    max_entries=settings.IMAGE_DEDUP_MAX_ENTRIES,
+    enabled=settings.IMAGE_DEDUP_ENABLED
+)
@@ -0,0 +1,214 @@
+"""
+Keyword Matcher Service
+All keyword tables used to route inbound messages (follow-up intents, call requests,
+crops, progress and yes-replies), compiled once at import into a single Aho-Corasick
+automaton that finds every match in one pass over the message.
+"""
+
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+# Follow-up intents, in priority order (the first listed intent with a match wins)
+INTENT_KEYWORDS: Dict[str, Dict[str, List[str]]] = {
+    "treatment": {
+        "english": ["treatment", "detailed solution", "treat", "cure", "remedy", "fix", "heal", "solution"],
+        "hindi": ["उपचार", "इलाज", "समाधान", "चिकित्सा", "उपाय"]
+    },
+    "prevention": {
+        "english": ["prevention", "protection", "prevent", "avoid", "stop", "protect", "precaution", "safety"],
+        "hindi": ["रोकथाम", "बचाव", "सुरक्षा", "बचना", "रोकना", "सावधानी"]
+    },
+    "medicine": {
+        "english": ["medicine", "pesticide", "medication", "drug", "spray", "fungicide", "chemical", "insecticide"],
+        "hindi": ["दवा", "कीटनाशक", "दवाई", "छिड़काव", "रसायन", "केमिकल", "स्प्रे"]
+    },
+    "dosage": {
+        "english": ["dosage", "quantity", "amount", "dose", "measurement", "calculation"],
+        "hindi": ["खुराक", "मात्रा", "डोज", "नाप", "परिमाण"]
+    },
+    "cost": {
+        "english": ["cost", "budget", "price", "expense", "money", "rate", "charges"],
+        "hindi": ["कीमत", "लागत", "खर्च", "दाम", "रेट", "पैसा"]
+    },
+    "management": {
+        "english": ["management", "care", "farming", "cultivation", "maintenance", "handling"],
+        "hindi": ["प्रबंधन", "देखभाल", "खेती", "रखरखाव", "संभाल"]
+    },
+    "timing": {
+        "english": ["timing", "calendar", "schedule", "time", "when", "period", "duration"],
+        "hindi": ["समय", "कैलेंडर", "टाइमिंग", "कब", "अवधि", "समयसारणी"]
+    },
+    "emergency": {
+        "english": ["urgent", "emergency", "immediate", "asap", "critical", "serious", "help"],
+        "hindi": ["तुरंत", "आपातकाल", "जरूरी", "गंभीर", "मदद", "इमरजेंसी"]
+    }
+}
+
+# Direct voice-call requests (matched anywhere in the message)
+CALL_PATTERNS: List[str] = [
+    # English
+    'call me', 'call kar', 'call karo', 'call please',
+    'phone call', 'voice call', 'baat karna chahiye',
+    'call back', 'ring me', 'phone karo', 'call now',
+    # Hindi
+    'कॉल करें', 'कॉल कर', 'कॉल करो', 'फोन करें',
+    'फोन करो', 'बात करना चाहिए', 'बात करना है',
+    'आवाज़ में बात', 'voice में बात', 'बोल कर बताएं',
+    'कॉल पर बात', 'फोन पर बात', 'call करें', 'call करो'
+]
+
+# Crops and their Hindi/English names, in priority order
+CROP_KEYWORDS: Dict[str, List[str]] = {
+    'rice': ['rice', 'chawal', 'dhan', 'paddy'],
+    'wheat': ['wheat', 'gehun', 'gahu'],
+    'cotton': ['cotton', 'kapas', 'rui'],
+    'tomato': ['tomato', 'tamatar'],
+    'potato': ['potato', 'aloo', 'batata'],
+    'onion': ['onion', 'pyaj', 'kanda'],
+    'sugarcane': ['sugarcane', 'ganna', 'ikhu'],
+    'maize': ['maize', 'corn', 'makka', 'bhutta'],
+    'soybean': ['soybean', 'soya', 'bhatmas'],
+    'groundnut': ['groundnut', 'peanut', 'moongfali'],
+    'banana': ['banana', 'kela'],
+    'mango': ['mango', 'aam'],
+    'chili': ['chili', 'pepper', 'mirch', 'lal mirch'],
+    'cabbage': ['cabbage', 'patta gobi'],
+    'cauliflower': ['cauliflower', 'phool gobi'],
+    'brinjal': ['brinjal', 'eggplant', 'baingan'],
+    'okra': ['okra', 'bhindi', 'lady finger']
+}
+
+# Progress-update requests (the whole message must be one of these)
+PROGRESS_KEYWORDS: List[str] = ['progress', 'प्रोग्रेस', 'स्टेटस', 'status', 'update', 'हाल']
+
+# Yes-replies to the voice bot question (the whole message must be one of these)
+AFFIRMATIVE_REPLIES: List[str] = ['yes', 'y', 'हाँ', 'हां', 'han', 'haan', 'ok', 'okay']
+
+# Categories that only count when the keyword is the entire message
+EXACT_CATEGORIES = {"progress", "affirmative"}
+
+
+class AhoCorasick:
+    """Multi-pattern substring automaton; each pattern carries a (category, label, priority) payload"""
+
+    def __init__(self, patterns: List[Tuple[str, Tuple[str, str, int]]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+        self.patterns = patterns
+
+        for index, (pattern, _) in enumerate(patterns):
+            node = 0
+            for char in pattern:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                node = next_node
+            self._output[node].append(index)
+
+        # Breadth-first fail links; outputs are merged so matching never walks the fail chain
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def find_all(self, text: str) -> List[Tuple[int, int, int]]:
+        """Every (start, end, pattern_index) occurrence in text"""
+        matches = []
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for index in self._output[node]:
+                end = position + 1
+                matches.append((end - len(self.patterns[index][0]), end, index))
+        return matches
+
+
+class KeywordMatches:
+    """Everything one message matched, grouped by category"""
+
+    __slots__ = ("intents", "crops", "call", "progress", "affirmative")
+
+    def __init__(self):
+        self.intents: List[str] = []
+        self.crops: List[str] = []
+        self.call = False
+        self.progress = False
+        self.affirmative = False
+
+    @property
+    def intent(self) -> Optional[str]:
+        """Highest-priority follow-up intent, or None"""
+        return self.intents[0] if self.intents else None
+
+    @property
+    def crop(self) -> str:
+        """Highest-priority crop, or ''"""
+        return self.crops[0] if self.crops else ""
+
+    def to_dict(self) -> Dict:
+        return {
+            "intents": self.intents,
+            "crops": self.crops,
+            "call": self.call,
+            "progress": self.progress,
+            "affirmative": self.affirmative
+        }
+
+
+def _build_patterns() -> List[Tuple[str, Tuple[str, str, int]]]:
+    patterns = []
+    for priority, (intent, keywords) in enumerate(INTENT_KEYWORDS.items()):
+        for keyword in keywords["english"] + keywords["hindi"]:
+            patterns.append((keyword.lower(), ("intent", intent, priority)))
+    for keyword in CALL_PATTERNS:
+        patterns.append((keyword.lower(), ("call", "call", 0)))
+    for priority, (crop, keywords) in enumerate(CROP_KEYWORDS.items()):
+        for keyword in keywords:
+            patterns.append((keyword.lower(), ("crop", crop, priority)))
+    for keyword in PROGRESS_KEYWORDS:
+        patterns.append((keyword.lower(), ("progress", "progress", 0)))
+    for keyword in AFFIRMATIVE_REPLIES:
+        patterns.append((keyword.lower(), ("affirmative", "affirmative", 0)))
+    return patterns
+
+
+# Compiled once at import
+keyword_automaton = AhoCorasick(_build_patterns())
+
+
+def match_keywords(message: str) -> KeywordMatches:
+    """Match every keyword table against the normalized message in a single pass"""
+    text = (message or "").lower().strip()
+    result = KeywordMatches()
+    intents: Dict[str, int] = {}
+    crops: Dict[str, int] = {}
+
+    for start, end, index in keyword_automaton.find_all(text):
+        category, label, priority = keyword_automaton.patterns[index][1]
+        if category in EXACT_CATEGORIES:
+            if start != 0 or end != len(text):
+                continue
+            setattr(result, category, True)
+        elif category == "intent":
+            intents[label] = priority
+        elif category == "crop":
+            crops[label] = priority
+        else:
+            result.call = True
+
+    result.intents = sorted(intents, key=intents.get)
+    result.crops = sorted(crops, key=crops.get)
+    return result
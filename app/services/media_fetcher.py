@@ -0,0 +1,118 @@
+"""
+Media Fetcher Service
+Connection-pooled, streaming download of Twilio media with a hard size cap.
+Oversized payloads are aborted as soon as the limit is crossed instead of being buffered in full.
+"""
+
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from app.config import settings
+
+
+class MediaTooLargeError(ValueError):
+    """Raised when a media download exceeds the configured size cap"""
+
+
+class MediaFetcher:
+    """Streams media into a bounded buffer over a shared keep-alive client"""
+
+    def __init__(self, max_bytes: int = 10 * 1024 * 1024, timeout: float = 30.0, max_connections: int = 20):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._client: Optional[httpx.AsyncClient] = None
+        self._stats = {"downloads": 0, "failed": 0, "oversized": 0, "bytes": 0, "seconds": 0.0, "last_ms": 0.0}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Create the pooled client on first use (inside the running event loop)"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                auth=(str(settings.TWILIO_ACCOUNT_SID), str(settings.TWILIO_AUTH_TOKEN)),
+                # Twilio redirects media to a signed CDN URL; httpx drops auth on the cross-host hop
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+                headers={"User-Agent": "TwilioMediaDownloader/1.0", "Accept": "image/*"}
+            )
+        return self._client
+
+    async def fetch(self, media_url: str) -> bytes:
+        """Download media into memory, aborting once it grows past max_bytes"""
+        started = time.perf_counter()
+        try:
+            async with self._get_client().stream("GET", media_url) as response:
+                if response.status_code == 401:
+                    raise ValueError(
+                        f"Twilio authentication failed. Check your ACCOUNT_SID and AUTH_TOKEN. "
+                        f"SID: {str(settings.TWILIO_ACCOUNT_SID)[:8]}..."
+                    )
+                if response.status_code != 200:
+                    await response.aread()
+                    raise ValueError(f"Failed to download image. Status: {response.status_code}, Response: {response.text[:300]}")
+
+                content_length = response.headers.get("Content-Length")
+                if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+                    raise MediaTooLargeError(f"Image too large: {content_length} bytes (limit {self.max_bytes})")
+
+                buffer = bytearray()
+                async for chunk in response.aiter_bytes():
+                    if len(buffer) + len(chunk) > self.max_bytes:
+                        raise MediaTooLargeError(f"Image too large: over {self.max_bytes} bytes")
+                    buffer.extend(chunk)
+
+        except MediaTooLargeError:
+            self._stats["oversized"] += 1
+            self._stats["failed"] += 1
+            raise
+        except httpx.TimeoutException:
+            self._stats["failed"] += 1
+            raise ValueError(f"Image download timed out after {self.timeout:.0f} seconds")
+        except httpx.TransportError as e:
+            self._stats["failed"] += 1
+            raise ValueError(f"Connection error while downloading image: {str(e)}")
+        except ValueError:
+            self._stats["failed"] += 1
+            raise
+
+        elapsed = time.perf_counter() - started
+        self._stats["downloads"] += 1
+        self._stats["bytes"] += len(buffer)
+        self._stats["seconds"] += elapsed
+        self._stats["last_ms"] = round(elapsed * 1000, 2)
+        print(f"[MEDIA] Downloaded {len(buffer)} bytes in {elapsed * 1000:.0f}ms")
+        return bytes(buffer)
+
+    async def close(self):
+        """Close the pooled client (called on app shutdown)"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def get_stats(self) -> Dict:
+        """Get download counts, latency and throughput"""
+        downloads = self._stats["downloads"]
+        seconds = self._stats["seconds"]
+        return {
+            "max_bytes": self.max_bytes,
+            "downloads": downloads,
+            "failed": self._stats["failed"],
+            "oversized": self._stats["oversized"],
+            "bytes": self._stats["bytes"],
+            "avg_ms": round(seconds / downloads * 1000, 2) if downloads else 0.0,
+            "last_ms": self._stats["last_ms"],
+            "throughput_kbps": round(self._stats["bytes"] / 1024 / seconds, 2) if seconds else 0.0
+        }
+
+
+# Global media fetcher instance
+media_fetcher = MediaFetcher(
+    max_bytes=settings.MEDIA_MAX_BYTES,
+    timeout=settings.MEDIA_DOWNLOAD_TIMEOUT,
+    max_connections=settings.MEDIA_MAX_CONNECTIONS
+)
@@ -0,0 +1,101 @@
+"""
+Media Preprocessor Service
+Downscales and re-encodes crop photos before vision analysis and storage.
+Phone photos are decoded, rotated upright, shrunk to a max edge and saved as EXIF-free JPEG.
+"""
+
+import asyncio
+import io
+import time
+from typing import Dict, Tuple
+
+from PIL import Image, ImageOps
+
+from app.config import settings
+
+
+class MediaPreprocessor:
+    """Decode → orient → downsize → re-encode pipeline with running byte savings"""
+
+    def __init__(self, max_edge: int = 1024, jpeg_quality: int = 85, enabled: bool = True):
+        self.max_edge = max_edge
+        self.jpeg_quality = jpeg_quality
+        self.enabled = enabled
+        self._stats = {"images": 0, "failed": 0, "bytes_in": 0, "bytes_out": 0, "seconds": 0.0}
+
+    def process(self, data: bytes) -> Tuple[bytes, Dict]:
+        """Return re-encoded JPEG bytes and a per-image report. Undecodable input is returned as-is."""
+        if not self.enabled:
+            return data, {"processed": False, "bytes_in": len(data), "bytes_out": len(data), "bytes_saved": 0}
+
+        started = time.perf_counter()
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                original_size = image.size
+                # Let the JPEG decoder scale down while decoding (no-op for other formats)
+                image.draft("RGB", (self.max_edge, self.max_edge))
+                # Apply the EXIF orientation before the metadata is dropped
+                image = ImageOps.exif_transpose(image)
+                if image.mode != "RGB":
+                    image = image.convert("RGB")
+                image.thumbnail((self.max_edge, self.max_edge), Image.Resampling.LANCZOS)
+
+                output = io.BytesIO()
+                # No exif= argument, so the re-encoded JPEG carries no EXIF/GPS metadata
+                image.save(output, format="JPEG", quality=self.jpeg_quality, optimize=True)
+                processed = output.getvalue()
+                new_size = image.size
+        except Exception as e:
+            self._stats["failed"] += 1
+            print(f"[MEDIA] Preprocessing failed, using original image: {e}")
+            return data, {"processed": False, "bytes_in": len(data), "bytes_out": len(data), "bytes_saved": 0}
+
+        elapsed = time.perf_counter() - started
+        self._stats["images"] += 1
+        self._stats["bytes_in"] += len(data)
+        self._stats["bytes_out"] += len(processed)
+        self._stats["seconds"] += elapsed
+
+        report = {
+            "processed": True,
+            "original_dimensions": original_size,
+            "dimensions": new_size,
+            "bytes_in": len(data),
+            "bytes_out": len(processed),
+            "bytes_saved": len(data) - len(processed),
+            "ms": round(elapsed * 1000, 2)
+        }
+        print(f"[MEDIA] {original_size} -> {new_size}, {len(data)} -> {len(processed)} bytes "
+              f"(saved {report['bytes_saved']} bytes) in {report['ms']}ms")
+        return processed, report
+
+    async def process_async(self, data: bytes) -> Tuple[bytes, Dict]:
+        """Run process() in a worker thread so decoding does not block the event loop"""
+        return await asyncio.to_thread(self.process, data)
+
+    def get_stats(self) -> Dict:
+        """Get totals of images processed and bytes saved"""
+        images = self._stats["images"]
+        bytes_in = self._stats["bytes_in"]
+        bytes_saved = bytes_in - self._stats["bytes_out"]
+        return {
+            "enabled": self.enabled,
+            "max_edge": self.max_edge,
+            "jpeg_quality": self.jpeg_quality,
+            "images": images,
+            "failed": self._stats["failed"],
+            "bytes_in": bytes_in,
+            "bytes_out": self._stats["bytes_out"],
+            "bytes_saved": bytes_saved,
+            "avg_bytes_saved": bytes_saved // images if images else 0,
+            "savings_ratio": round(bytes_saved / bytes_in, 3) if bytes_in else 0.0,
+            "avg_ms": round(self._stats["seconds"] / images * 1000, 2) if images else 0.0
+        }
+
+
+# Global media preprocessor instance
+media_preprocessor = MediaPreprocessor(
+    max_edge=settings.IMAGE_MAX_EDGE,
+    jpeg_quality=settings.IMAGE_JPEG_QUALITY,
+    enabled=settings.IMAGE_PREPROCESS_ENABLED
+)
@@ -0,0 +1,130 @@
+"""
+Message Router Service
+Classifies each inbound text message once - one keyword pass and at most one history read -
+and dispatches it through a handler table instead of a chain of checks that each read the DB.
+"""
+
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.services.follow_up_handler import follow_up_handler
+from app.services.keyword_matcher import KeywordMatches, match_keywords
+from app.services.mongo_db import get_recent_messages
+from app.services.webhook_queue import StageStats
+
+ROUTE_VOICE_BOT_REPLY = "voice_bot_reply"
+ROUTE_DIRECT_CALL = "direct_call"
+ROUTE_PROGRESS = "progress"
+ROUTE_FOLLOW_UP = "follow_up"
+ROUTE_CHAT = "chat"
+
+# How far back each check looks (newest first); the single history read covers the deepest
+VOICE_BOT_HISTORY = 5
+FOLLOW_UP_HISTORY = 10
+ANALYSIS_HISTORY = 15
+
+
+def has_voice_bot_prompt(recent_messages: List[Dict]) -> bool:
+    """Check if the voice bot question is among the recent messages"""
+    if len(recent_messages) < 2:
+        return False
+
+    for msg in reversed(recent_messages):
+        if (msg.get('is_bot', False) and
+            '🎙️' in msg.get('message', '') and
+            'KHETI AI EXPERT' in msg.get('message', '')):
+            return True
+
+    return False
+
+
+class RouteDecision:
+    """
+    Result of classifying one message. routes lists every route the message qualifies for,
+    in the order the webhook used to check them; chat is always last.
+    """
+
+    __slots__ = ("user_id", "phone_number", "message", "matches", "history", "routes", "route",
+                 "intent", "analysis_info", "classify_seconds")
+
+    def __init__(self, user_id: str, phone_number: str, message: str, matches: KeywordMatches,
+                 history: List[Dict]):
+        self.user_id = user_id
+        self.phone_number = phone_number
+        self.message = message
+        self.matches = matches
+        self.history = history
+        self.routes: List[str] = []
+        self.route = ""  # the route being dispatched
+        self.intent: Optional[str] = None
+        self.analysis_info: Dict[str, str] = {}
+        self.classify_seconds = 0.0
+
+
+RouteHandler = Callable[[RouteDecision], Awaitable[Optional[Dict]]]
+
+
+class MessageRouter:
+    """Single-pass classifier plus per-route counters and classification latency"""
+
+    def __init__(self):
+        self._classify_stats = StageStats()
+        self._routes: Dict[str, int] = {}
+        self._stats = {"classified": 0, "history_reads": 0, "fallthroughs": 0}
+
+    async def classify(self, user_id: str, phone_number: str, message: str) -> RouteDecision:
+        """Work out every route a text message qualifies for"""
+        started = time.perf_counter()
+        matches = match_keywords(message)
+
+        # Only yes-replies and follow-up keywords depend on what was said before
+        history: List[Dict] = []
+        if matches.affirmative or matches.intent:
+            history = await get_recent_messages(user_id, limit=ANALYSIS_HISTORY)
+            self._stats["history_reads"] += 1
+
+        decision = RouteDecision(user_id, phone_number, message, matches, history)
+        if matches.affirmative and has_voice_bot_prompt(history[:VOICE_BOT_HISTORY]):
+            decision.routes.append(ROUTE_VOICE_BOT_REPLY)
+        if matches.call:
+            decision.routes.append(ROUTE_DIRECT_CALL)
+        if matches.progress:
+            decision.routes.append(ROUTE_PROGRESS)
+        if matches.intent and follow_up_handler.has_follow_up_context(history[:FOLLOW_UP_HISTORY]):
+            decision.routes.append(ROUTE_FOLLOW_UP)
+            decision.intent = matches.intent
+            decision.analysis_info = follow_up_handler.analysis_info_from_messages(history[:ANALYSIS_HISTORY])
+        decision.routes.append(ROUTE_CHAT)
+
+        decision.classify_seconds = time.perf_counter() - started
+        self._classify_stats.record(decision.classify_seconds)
+        self._stats["classified"] += 1
+        return decision
+
+    async def dispatch(self, decision: RouteDecision, handlers: Dict[str, RouteHandler]) -> Dict:
+        """
+        Run the handler for the first route; a handler returning None (e.g. a call that
+        could not be placed) falls through to the next route, as the old check chain did.
+        """
+        for route in decision.routes:
+            decision.route = route
+            result = await handlers[route](decision)
+            if result is not None:
+                self._routes[route] = self._routes.get(route, 0) + 1
+                print(f"[ROUTER] {decision.user_id} -> {route} "
+                      f"(classified in {decision.classify_seconds * 1000:.1f}ms)")
+                return result
+            self._stats["fallthroughs"] += 1
+        return {"status": "success"}
+
+    def get_stats(self) -> Dict:
+        """Get route counts and classification latency"""
+        return {
+            **self._stats,
+            "routes": dict(self._routes),
+            "classify": self._classify_stats.to_dict()
+        }
+
+
+# Global message router instance
+message_router = MessageRouter()
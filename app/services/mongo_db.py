@@ -1,110 +1,327 @@
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, WriteConcern
+from pymongo.errors import DuplicateKeyError
 from app.config import settings
 from app.utils.helper import extract_phone_number
 from datetime import datetime
+from typing import Dict, List
 from app.models import MessageSchema, UserSchema
+from app.services.blob_store import create_blob_store
+from app.services.history_cache import HistoryCache
+from app.services.phone_cache import PhoneCache
+from app.services.keyword_matcher import match_keywords
+from app.services.write_buffer import WriteBehindBuffer
+import base64
 
-client = MongoClient(settings.MONGO_URI)
-db = client["whatsapp_bot"]
+def _build_write_concern() -> WriteConcern:
+    """Build the write concern from settings ("majority" or a node count like "1")"""
+    w = settings.MONGO_WRITE_CONCERN
+    return WriteConcern(
+        w=int(w) if w.isdigit() else w,
+        j=settings.MONGO_JOURNAL
+    )
+
+client = AsyncIOMotorClient(
+    settings.MONGO_URI,
+    maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+    minPoolSize=settings.MONGO_MIN_POOL_SIZE
+)
+db = client.get_database("whatsapp_bot", write_concern=_build_write_concern())
 
 # Collections
 users_collection = db["users"]
 # Ensure the "messages" collection exists or is referenced correctly
 messages_collection = db.get_collection("messages")
 
+# Crop images live in a content-addressed blob store; messages keep only the reference
+blob_store = create_blob_store(settings.BLOB_STORE_BACKEND, db, settings.BLOB_STORE_PATH)
+
+# History reads skip inline image payloads (legacy documents still carry them); image_base64
+# comes back as True/False so readers can still tell an image was shared (MongoDB 4.4+)
+HISTORY_PROJECTION = {
+    "user_id": 1, "phone_number": 1, "message": 1, "image_ref": 1,
+    "crop_type": 1, "is_bot": 1, "timestamp": 1,
+    "image_base64": {"$gt": ["$image_base64", ""]},
+}
+
+# Indexes created at startup: (collection, keys, options)
+INDEX_SPECS = [
+    (users_collection, [("user_id", ASCENDING)], {"name": "user_id_unique", "unique": True}),
+    (messages_collection, [("user_id", ASCENDING), ("timestamp", DESCENDING)], {"name": "user_id_timestamp_desc"}),
+]
+
+# Build status per index, keyed by "collection.index_name"
+index_status: Dict[str, Dict] = {
+    f"{collection.name}.{options['name']}": {"status": "pending"}
+    for collection, _, options in INDEX_SPECS
+}
+
+# Recent history shared by all lookups for the same user until their next save
+history_cache = HistoryCache(
+    depth=settings.HISTORY_CACHE_DEPTH,
+    ttl=settings.HISTORY_CACHE_TTL,
+    max_users=settings.HISTORY_CACHE_MAX_USERS
+)
+
+# Phone numbers copied onto every saved message, without a users lookup per message
+phone_cache = PhoneCache(ttl=settings.PHONE_CACHE_TTL, max_users=settings.PHONE_CACHE_MAX_USERS)
+
+# save_user outcomes: skipped (seen recently), upserts (one round trip each), inserted (new users)
+user_registration_stats = {"skipped": 0, "upserts": 0, "inserted": 0}
+
+# Message inserts are queued and written in batches off the reply path
+message_buffer = WriteBehindBuffer(
+    messages_collection,
+    max_batch=settings.MESSAGE_FLUSH_BATCH,
+    flush_interval=settings.MESSAGE_FLUSH_INTERVAL,
+    max_backlog=settings.MESSAGE_BUFFER_MAX,
+    max_attempts=settings.MESSAGE_FLUSH_MAX_ATTEMPTS,
+    enabled=settings.MESSAGE_WRITE_BEHIND
+)
+
+
+async def ensure_indexes():
+    """Create the indexes the hot queries rely on (run once at app startup)"""
+    for collection, keys, options in INDEX_SPECS:
+        index_key = f"{collection.name}.{options['name']}"
+        index_status[index_key] = {"status": "building", "started_at": datetime.now().isoformat()}
+        try:
+            await collection.create_index(keys, **options)
+            index_status[index_key].update({"status": "ready", "finished_at": datetime.now().isoformat()})
+            print(f"[DB] Index ready: {index_key}")
+        except Exception as e:
+            # A unique index fails to build if duplicate users already exist
+            index_status[index_key].update({"status": "failed", "error": str(e)})
+            print(f"[DB] Index build failed for {index_key}: {e}")
+
+def _summarize_plan(explain: Dict) -> Dict:
+    """Reduce explain() output to the winning plan's stages, index and work done"""
+    stages: List[str] = []
+    index_names: List[str] = []
+    plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+    plan = plan.get("queryPlan", plan)  # slot-based engine nests the plan one level down
+    while plan:
+        stages.append(plan.get("stage", ""))
+        if plan.get("indexName"):
+            index_names.append(plan["indexName"])
+        plan = plan.get("inputStage")
 
-def save_user(user_id: str, phone_number: str = "", name: str = ""):
-    """Save user info only once - prevents duplicates"""
+    execution = explain.get("executionStats", {})
+    return {
+        "stages": stages,
+        "indexes_used": index_names,
+        "collection_scan": "COLLSCAN" in stages,
+        "docs_examined": execution.get("totalDocsExamined"),
+        "keys_examined": execution.get("totalKeysExamined"),
+        "execution_ms": execution.get("executionTimeMillis")
+    }
+
+async def get_index_report(sample_user_id: str = "") -> Dict:
+    """Index definitions, build status and query plans for the hot user/message queries"""
+    report: Dict = {"status": index_status, "indexes": {}, "in_progress": [], "query_plans": {}}
+
+    for collection in (users_collection, messages_collection):
+        try:
+            report["indexes"][collection.name] = await collection.index_information()
+        except Exception as e:
+            report["indexes"][collection.name] = {"error": str(e)}
+
+    try:
+        current_ops = await client.admin.command({"currentOp": 1, "command.createIndexes": {"$exists": True}})
+        report["in_progress"] = [
+            {"ns": op.get("ns"), "progress": op.get("progress"), "msg": op.get("msg")}
+            for op in current_ops.get("inprog", [])
+        ]
+    except Exception as e:
+        report["in_progress"] = {"error": str(e)}
+
+    plans = {
+        "users.find_one_by_user_id": users_collection.find({"user_id": sample_user_id}).limit(1),
+        "messages.recent_by_user": messages_collection.find(
+            {"user_id": sample_user_id}, HISTORY_PROJECTION
+        ).sort("timestamp", -1).limit(history_cache.depth),
+    }
+    for name, cursor in plans.items():
+        try:
+            report["query_plans"][name] = _summarize_plan(await cursor.explain())
+        except Exception as e:
+            report["query_plans"][name] = {"error": str(e)}
+
+    return report
+
+async def save_user(user_id: str, phone_number: str = "", name: str = ""):
+    """
+    Save user info only once - prevents duplicates.
+    Registration is one atomic upsert (backed by the unique user_id index), and users seen
+    recently by this process skip the database entirely.
+    """
     # Clean phone number
     clean_phone = extract_phone_number(phone_number) if phone_number else ""
-    
-    # Check if user already exists
-    existing_user = users_collection.find_one({"user_id": user_id})
-    
-    if not existing_user:
-        user_data = UserSchema(
-            user_id=user_id,
-            phone_number=clean_phone,
-            name=name if name else None
-        ).dict()
-        users_collection.insert_one(user_data)
+
+    # The phone cache only holds users known to exist; skip unless there is a phone to add
+    known_phone = phone_cache.get(user_id)
+    if known_phone is not None and (known_phone or not clean_phone):
+        user_registration_stats["skipped"] += 1
+        return
+
+    user_data = UserSchema(
+        user_id=user_id,
+        phone_number=clean_phone,
+        name=name if name else None
+    ).dict()
+    try:
+        existing_user = await users_collection.find_one_and_update(
+            {"user_id": user_id},
+            {"$setOnInsert": user_data},
+            upsert=True,
+            projection={"phone_number": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+    except DuplicateKeyError:
+        # A concurrent upsert for the same user inserted first
+        existing_user = await users_collection.find_one({"user_id": user_id}, {"phone_number": 1}) or {}
+    user_registration_stats["upserts"] += 1
+
+    if existing_user is None:
+        user_registration_stats["inserted"] += 1
+        phone_cache.put(user_id, clean_phone)
         print(f"[DB] New user saved: {user_id} | Phone: {clean_phone}")
-    else:
-        # Update phone number if it wasn't stored before
-        if clean_phone and not existing_user.get("phone_number"):
-            users_collection.update_one(
-                {"user_id": user_id},
-                {
-                    "$set": {
-                        "phone_number": clean_phone,
-                        "updated_at": datetime.now()
-                    }
+        return
+
+    # Update phone number if it wasn't stored before
+    stored_phone = existing_user.get("phone_number") or ""
+    if clean_phone and not stored_phone:
+        await users_collection.update_one(
+            {"user_id": user_id, "phone_number": {"$in": ["", None]}},
+            {
+                "$set": {
+                    "phone_number": clean_phone,
+                    "updated_at": datetime.now()
                 }
-            )
-            print(f"[DB] User phone updated: {user_id} | Phone: {clean_phone}")
+            }
+        )
+        stored_phone = clean_phone
+        print(f"[DB] User phone updated: {user_id} | Phone: {clean_phone}")
+    phone_cache.put(user_id, stored_phone)
 
-def save_message(user_id: str, message: str = "", image_base64: str = "", 
-                is_bot: bool = False, crop_type: str = ""):
-    """Save message with all required fields"""
-    
-    # Get user's phone number
-    user = users_collection.find_one({"user_id": user_id})
-    phone_number = user.get("phone_number", "") if user else ""
+async def save_message(user_id: str, message: str = "", image_base64: str = "", 
+                is_bot: bool = False, crop_type: str = "", phone_number: str = ""):
+    """
+    Save message with all required fields.
+    Pass phone_number when the caller knows it (WhatsApp routes); otherwise it comes from
+    the phone cache. With the write buffer running the message is queued and written in the next batch.
+    """
+    buffered = message_buffer.is_running()
+
+    if phone_number:
+        phone_number = extract_phone_number(phone_number)
+        phone_cache.record_pass_through()
+    else:
+        cached = phone_cache.get(user_id)
+        if cached is not None:
+            phone_number = cached
+        elif not buffered:
+            # With the write buffer running, a miss is looked up once per batch instead
+            user = await users_collection.find_one({"user_id": user_id})
+            phone_number = user.get("phone_number", "") if user else ""
+            if user:
+                phone_cache.put(user_id, phone_number)
+
+    # Store the image once in the blob store and keep only its reference
+    image_ref = await blob_store.put(base64.b64decode(image_base64)) if image_base64 else ""
     
     message_obj = MessageSchema(
         user_id=user_id,
         phone_number=phone_number,
         message=message,
-        image_base64=image_base64,
+        image_ref=image_ref,
         crop_type=crop_type,
         is_bot=is_bot
     )
-    message_data = message_obj.dict()
+    message_data = message_obj.dict(exclude={"image_base64"})
     
-    result = messages_collection.insert_one(message_data)
+    if buffered:
+        inserted_id = await message_buffer.add(message_data)
+        history_cache.invalidate(user_id)
+        print(f"[DB] Message queued: {user_id} | Bot: {is_bot} | Crop: {crop_type}")
+        return inserted_id
+
+    result = await messages_collection.insert_one(message_data)
+    history_cache.invalidate(user_id)
     print(f"[DB] Message saved: {user_id} | Bot: {is_bot} | Crop: {crop_type}")
     return result.inserted_id
 
-def get_user_phone(user_id: str) -> str:
+async def _fill_phone_numbers(docs: List[Dict]):
+    """Copy each user's phone number into a batch of queued messages with one query"""
+    missing = [doc for doc in docs if not doc.get("phone_number")]
+    phones = {}
+    for doc in missing:
+        cached = phone_cache.get(doc["user_id"])
+        if cached is not None:
+            phones[doc["user_id"]] = cached
+    user_ids = list({doc["user_id"] for doc in missing} - set(phones))
+    if user_ids:
+        async for user in users_collection.find({"user_id": {"$in": user_ids}}, {"user_id": 1, "phone_number": 1}):
+            phones[user["user_id"]] = user.get("phone_number", "")
+            phone_cache.put(user["user_id"], phones[user["user_id"]])
+    for doc in missing:
+        doc["phone_number"] = phones.get(doc["user_id"], "")
+
+def _invalidate_histories(user_ids: List[str]):
+    # Histories cached while these messages were queued don't include them
+    for user_id in user_ids:
+        history_cache.invalidate(user_id)
+
+async def start_message_buffer():
+    """Start batching message inserts (run once at app startup)"""
+    await message_buffer.start(prepare=_fill_phone_numbers, on_flushed=_invalidate_histories)
+
+async def stop_message_buffer():
+    """Write every queued message before the process exits"""
+    await message_buffer.stop()
+
+def _with_pending(pending: List[Dict], messages: List[Dict], limit: int) -> List[Dict]:
+    """Put queued (not yet written) messages in front of stored history, newest first"""
+    if not pending:
+        return messages[:limit]
+    stored_ids = {message.get("_id") for message in messages}
+    return ([doc for doc in pending if doc["_id"] not in stored_ids] + messages)[:limit]
+
+async def get_user_phone(user_id: str) -> str:
     """Get user's phone number"""
-    user = users_collection.find_one({"user_id": user_id})
-    return user.get("phone_number", "") if user else ""
-
-def get_recent_messages(user_id: str, limit: int = 10):
-    """Get recent messages for a user (for context if needed)"""
-    messages = messages_collection.find(
-        {"user_id": user_id}
-    ).sort("timestamp", -1).limit(limit)
+    cached = phone_cache.get(user_id)
+    if cached is not None:
+        return cached
+    user = await users_collection.find_one({"user_id": user_id})
+    phone_number = user.get("phone_number", "") if user else ""
+    # Unknown users aren't cached, so a phone saved for them later is picked up
+    if user:
+        phone_cache.put(user_id, phone_number)
+    return phone_number
+
+async def get_recent_messages(user_id: str, limit: int = 10):
+    """
+    Get recent messages for a user (for context if needed), newest first.
+    Legacy inline image payloads are reduced to an image_base64 flag; new messages carry image_ref.
+    """
+    # Taken before the read, so a batch written meanwhile is deduplicated rather than missed
+    pending = message_buffer.pending_for(user_id)
+
+    cached = history_cache.get(user_id, limit)
+    if cached is not None:
+        return _with_pending(pending, cached, limit)
+
+    # Read a little deeper than asked so other lookups for this message hit the cache
+    fetch_limit = max(limit, history_cache.depth)
+    generation = history_cache.generation(user_id)
+    cursor = messages_collection.find(
+        {"user_id": user_id}, HISTORY_PROJECTION
+    ).sort("timestamp", -1).limit(fetch_limit)
     
-    return list(messages)
+    messages = await cursor.to_list(length=fetch_limit)
+    history_cache.put(user_id, messages, fetch_limit, generation)
+    return _with_pending(pending, messages, limit)
 
 def extract_crop_type_from_text(text: str) -> str:
     """Simple crop type extraction from text"""
-    text_lower = text.lower()
-    
-    # Common crop keywords in Hindi and English
-    crop_keywords = {
-        'rice': ['rice', 'chawal', 'dhan', 'paddy'],
-        'wheat': ['wheat', 'gehun', 'gahu'],
-        'cotton': ['cotton', 'kapas', 'rui'],
-        'tomato': ['tomato', 'tamatar'],
-        'potato': ['potato', 'aloo', 'batata'],
-        'onion': ['onion', 'pyaj', 'kanda'],
-        'sugarcane': ['sugarcane', 'ganna', 'ikhu'],
-        'maize': ['maize', 'corn', 'makka', 'bhutta'],
-        'soybean': ['soybean', 'soya', 'bhatmas'],
-        'groundnut': ['groundnut', 'peanut', 'moongfali'],
-        'banana': ['banana', 'kela'],
-        'mango': ['mango', 'aam'],
-        'chili': ['chili', 'pepper', 'mirch', 'lal mirch'],
-        'cabbage': ['cabbage', 'patta gobi'],
-        'cauliflower': ['cauliflower', 'phool gobi'],
-        'brinjal': ['brinjal', 'eggplant', 'baingan'],
-        'okra': ['okra', 'bhindi', 'lady finger']
-    }
-    
-    for crop, keywords in crop_keywords.items():
-        if any(keyword in text_lower for keyword in keywords):
-            return crop
-    
-    return ""
\ No newline at end of file
+    return match_keywords(text).crop
\ No newline at end of file
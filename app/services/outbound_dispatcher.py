@@ -0,0 +1,196 @@
+"""
+Outbound Dispatcher Service
+Async WhatsApp sender that pipelines Twilio REST calls across recipients over one pooled connection.
+Each recipient's messages are sent strictly in the order they were queued.
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import httpx
+
+from app.config import settings
+
+TWILIO_API_BASE = "https://api.twilio.com/2010-04-01"
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class OutboundDispatcher:
+    """
+    Worker pool that drains per-recipient FIFO queues.
+    A recipient is served by at most one worker at a time, so chunk order is kept,
+    while different recipients are sent to concurrently.
+    """
+
+    def __init__(self, worker_count: int = 8, max_retries: int = 4,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0, max_connections: int = 20):
+        self.worker_count = worker_count
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_connections = max_connections
+        self._pending: Dict[str, Deque[Tuple[str, asyncio.Future]]] = {}
+        self._ready: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._http: Optional[httpx.AsyncClient] = None
+        self._stats = {"queued": 0, "sent": 0, "retries": 0, "failed": 0, "send_seconds": 0.0}
+
+    def is_running(self) -> bool:
+        """Check if the dispatcher workers have been started"""
+        return bool(self._workers)
+
+    async def start(self):
+        """Open the pooled Twilio connection and start the workers"""
+        if self._workers:
+            return
+
+        self._http = httpx.AsyncClient(
+            base_url=TWILIO_API_BASE,
+            auth=(settings.TWILIO_ACCOUNT_SID or "", settings.TWILIO_AUTH_TOKEN or ""),
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections
+            ),
+            timeout=httpx.Timeout(15.0, connect=5.0)
+        )
+        self._ready = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"outbound-worker-{i}")
+            for i in range(self.worker_count)
+        ]
+        print(f"[OUTBOUND] Dispatcher started with {self.worker_count} workers")
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Send whatever is still queued (up to drain_timeout seconds) and stop"""
+        if not self._workers:
+            return
+
+        try:
+            await asyncio.wait_for(self._ready.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"[OUTBOUND] Drain timed out with {self.pending_messages()} messages unsent")
+
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await self._http.aclose()
+        print("[OUTBOUND] Dispatcher stopped")
+
+    def enqueue(self, to: str, body: str) -> asyncio.Future:
+        """
+        Queue a message for a recipient (formatted as 'whatsapp:+91...').
+        Returns a future resolved with the Twilio message SID, or None if sending failed.
+        """
+        future = asyncio.get_running_loop().create_future()
+        queue = self._pending.get(to)
+        if queue is None:
+            queue = self._pending[to] = deque()
+            self._ready.put_nowait(to)
+        queue.append((body, future))
+        self._stats["queued"] += 1
+        return future
+
+    def pending_messages(self) -> int:
+        """Number of messages queued but not yet sent"""
+        return sum(len(queue) for queue in self._pending.values())
+
+    def get_stats(self) -> Dict:
+        """Get queue backlog and send/retry counters"""
+        sent = self._stats["sent"]
+        return {
+            "running": self.is_running(),
+            "worker_count": len(self._workers),
+            "pending_recipients": len(self._pending),
+            "pending_messages": self.pending_messages(),
+            "queued": self._stats["queued"],
+            "sent": sent,
+            "retries": self._stats["retries"],
+            "failed": self._stats["failed"],
+            "avg_send_ms": round(self._stats["send_seconds"] / sent * 1000, 2) if sent else 0.0
+        }
+
+    async def _worker(self, worker_id: int):
+        """Take a recipient off the ready queue and send all of its messages in order"""
+        while True:
+            to = await self._ready.get()
+            queue = self._pending[to]
+            try:
+                while queue:
+                    body, future = queue[0]
+                    try:
+                        sid = await self._send_with_retry(to, body)
+                    except Exception as e:
+                        print(f"[OUTBOUND] Worker {worker_id} error for {to}: {e}")
+                        sid = None
+                    queue.popleft()
+                    if not future.done():
+                        future.set_result(sid)
+            finally:
+                # No await between the last popleft and this, so a new enqueue re-registers the recipient
+                if not queue:
+                    self._pending.pop(to, None)
+                else:
+                    self._ready.put_nowait(to)
+                self._ready.task_done()
+
+    async def _send_with_retry(self, to: str, body: str) -> Optional[str]:
+        """POST one message to Twilio, retrying 429/5xx and network errors with backoff"""
+        payload = {
+            "From": f"whatsapp:{settings.TWILIO_PHONE_NUMBER}",
+            "To": to,
+            "Body": body
+        }
+        url = f"/Accounts/{settings.TWILIO_ACCOUNT_SID}/Messages.json"
+
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            retry_after = None
+            try:
+                response = await self._http.post(url, data=payload)
+                if response.status_code < 300:
+                    self._stats["sent"] += 1
+                    self._stats["send_seconds"] += time.perf_counter() - started
+                    try:
+                        return response.json().get("sid")
+                    except ValueError:
+                        return None
+
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    self._stats["failed"] += 1
+                    print(f"[OUTBOUND] Send to {to} failed ({response.status_code}): {response.text[:200]}")
+                    return None
+
+                retry_after = response.headers.get("Retry-After")
+                error = f"HTTP {response.status_code}"
+            except httpx.TransportError as e:
+                error = str(e) or type(e).__name__
+
+            if attempt == self.max_retries:
+                break
+
+            delay = min(self.backoff_max, self.backoff_base * (2 ** attempt)) + random.uniform(0, self.backoff_base)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            self._stats["retries"] += 1
+            print(f"[OUTBOUND] Retrying send to {to} in {delay:.1f}s ({error})")
+            await asyncio.sleep(delay)
+
+        self._stats["failed"] += 1
+        print(f"[OUTBOUND] Giving up on send to {to} after {self.max_retries + 1} attempts")
+        return None
+
+
+# Global outbound dispatcher instance
+outbound_dispatcher = OutboundDispatcher(
+    worker_count=settings.OUTBOUND_WORKER_COUNT,
+    max_retries=settings.OUTBOUND_MAX_RETRIES,
+    backoff_base=settings.OUTBOUND_BACKOFF_BASE,
+    backoff_max=settings.OUTBOUND_BACKOFF_MAX,
+    max_connections=settings.OUTBOUND_MAX_CONNECTIONS
+)
@@ -0,0 +1,52 @@
+"""
+Phone Cache Service
+In-process LRU of user_id -> phone number, so saving a message no longer looks the
+user up in the users collection just to copy the phone number onto it.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class PhoneCache:
+    """LRU cache of user phone numbers with TTL expiry"""
+
+    def __init__(self, ttl: float = 3600.0, max_users: int = 50000):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "passed_through": 0}
+
+    def get(self, user_id: str) -> Optional[str]:
+        """Return the cached phone number ("" if the user has none), or None on a miss"""
+        entry = self._entries.get(user_id)
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            if entry is not None:
+                del self._entries[user_id]
+            self._stats["misses"] += 1
+            return None
+
+        self._entries.move_to_end(user_id)
+        self._stats["hits"] += 1
+        return entry[0]
+
+    def put(self, user_id: str, phone_number: str):
+        self._entries[user_id] = (phone_number, time.monotonic())
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+
+    def record_pass_through(self):
+        """Count a save whose caller already knew the phone number"""
+        self._stats["passed_through"] += 1
+
+    def get_stats(self) -> Dict:
+        """Get cache size and hit/miss counters"""
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            "cached_users": len(self._entries),
+            "ttl_seconds": self.ttl,
+            **self._stats,
+            "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else 0.0
+        }
@@ -0,0 +1,101 @@
+"""
+Response Cache Service
+Caches follow-up answers (treatment, prevention, medicine) per normalized
+(intent, crop, disease, language), so the same crop/disease question asked all season
+is answered instantly. Keys carry the prompt version, so editing a prompt retires old answers.
+"""
+
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from app.config import settings
+
+_PUNCTUATION = re.compile(r"[^\w\s\u0900-\u0963\u0966-\u097F]")  # keeps Devanagari vowel signs (not matched by \w), drops dandas
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_key_part(value: str) -> str:
+    """Case-, punctuation- and spacing-insensitive form of a crop or disease name"""
+    value = unicodedata.normalize("NFC", value or "").lower()
+    value = _PUNCTUATION.sub(" ", value)
+    return _WHITESPACE.sub(" ", value).strip()
+
+
+class ResponseCache:
+    """LRU + TTL cache of generated responses with per-key hit counters"""
+
+    def __init__(self, ttl: float = 86400.0, max_entries: int = 5000, enabled: bool = True):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries: "OrderedDict[Tuple, Tuple[str, float]]" = OrderedDict()
+        # Per-key [hits, misses]; bounded like the entries
+        self._key_stats: "OrderedDict[Tuple, list]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "bypassed": 0, "stores": 0}
+
+    def make_key(self, intent: str, crop: str, disease: str, language: str, version: str) -> Tuple:
+        return (intent, normalize_key_part(crop), normalize_key_part(disease), language, version)
+
+    def get(self, key: Tuple) -> Optional[str]:
+        """Return the cached response for a key, or None on a miss"""
+        entry = self._entries.get(key)
+        key_stats = self._key_stats.setdefault(key, [0, 0])
+        self._key_stats.move_to_end(key)
+
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            if entry is not None:
+                del self._entries[key]
+            key_stats[1] += 1
+            self._stats["misses"] += 1
+            self._trim(self._key_stats)
+            return None
+
+        self._entries.move_to_end(key)
+        key_stats[0] += 1
+        self._stats["hits"] += 1
+        return entry[0]
+
+    def put(self, key: Tuple, response: str):
+        self._entries[key] = (response, time.monotonic())
+        self._entries.move_to_end(key)
+        self._stats["stores"] += 1
+        self._trim(self._entries)
+
+    def record_bypass(self):
+        """Count a lookup skipped because the turn was personalized"""
+        self._stats["bypassed"] += 1
+
+    def _trim(self, mapping: OrderedDict):
+        while len(mapping) > self.max_entries:
+            mapping.popitem(last=False)
+
+    def get_stats(self, top: int = 20) -> Dict:
+        """Get overall counters and the most-hit keys with their hit rates"""
+        lookups = self._stats["hits"] + self._stats["misses"]
+        busiest = sorted(self._key_stats.items(), key=lambda item: item[1][0], reverse=True)[:top]
+        return {
+            "enabled": self.enabled,
+            "ttl_seconds": self.ttl,
+            "entries": len(self._entries),
+            **self._stats,
+            "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else 0.0,
+            "keys": [
+                {
+                    "intent": key[0], "crop": key[1], "disease": key[2], "language": key[3], "version": key[4],
+                    "hits": hits, "misses": misses,
+                    "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0
+                }
+                for key, (hits, misses) in busiest
+            ]
+        }
+
+
+# Global response cache instance
+response_cache = ResponseCache(
+    ttl=settings.RESPONSE_CACHE_TTL,
+    max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    enabled=settings.RESPONSE_CACHE_ENABLED
+)
@@ -1,43 +1,121 @@
 from typing import Dict, List, Optional, Tuple
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from datetime import datetime
+import asyncio
+import hashlib
+import sys
 import threading
 import time
-from dataclasses import dataclass
 from enum import Enum
 
+from app.config import settings
+from app.services.context_builder import ContextBuilder
+from app.services.prompts import estimate_message_tokens
+from app.services.session_store import SessionStore, MemorySessionStore, create_session_store
+
 class MessageType(Enum):
     USER = "user"
     ASSISTANT = "assistant"
     SYSTEM = "system"
 
-@dataclass
+# Interned role strings shared by every Message
+ROLE_USER = sys.intern("user")
+ROLE_ASSISTANT = sys.intern("assistant")
+ROLE_SYSTEM = sys.intern("system")
+ROLES = {MessageType.USER: ROLE_USER, MessageType.ASSISTANT: ROLE_ASSISTANT, MessageType.SYSTEM: ROLE_SYSTEM}
+
+def _monotonic_to_epoch(ts: float) -> float:
+    return time.time() - (time.monotonic() - ts)
+
+def _epoch_to_monotonic(epoch: float) -> float:
+    return time.monotonic() - (time.time() - epoch)
+
+class SessionImageCache:
+    """Base64 images referenced by session messages, keyed by digest and bounded by total size"""
+    
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._images: "OrderedDict[str, str]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+    
+    def put(self, image_base64: str) -> str:
+        """Store an image and return its reference"""
+        ref = hashlib.sha256(image_base64.encode("ascii", "ignore")).hexdigest()
+        with self._lock:
+            if ref in self._images:
+                self._images.move_to_end(ref)
+                return ref
+            self._images[ref] = image_base64
+            self._bytes += len(image_base64)
+            while self._bytes > self.max_bytes and len(self._images) > 1:
+                _, evicted = self._images.popitem(last=False)
+                self._bytes -= len(evicted)
+        return ref
+    
+    def get(self, ref: str) -> Optional[str]:
+        """The image for a reference, or None once it has been evicted"""
+        with self._lock:
+            return self._images.get(ref)
+    
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {"images": len(self._images), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+# Global image cache for session messages
+session_images = SessionImageCache(max_bytes=settings.SESSION_IMAGE_CACHE_MB * 1024 * 1024)
+
 class Message:
-    """Represents a single message in the conversation"""
-    content: str
-    message_type: MessageType
-    timestamp: datetime
-    image_base64: Optional[str] = None
+    """
+    Represents a single message in the conversation.
+    Slotted and immutable once created: the timestamp is a monotonic float, images are held by
+    reference into session_images, and the OpenAI form and token estimate are computed once.
+    """
+    __slots__ = ("content", "role", "timestamp", "image_ref", "seq", "_openai", "_tokens")
+    
+    def __init__(self, content: str, role: str, timestamp: Optional[float] = None,
+                 image_ref: Optional[str] = None, seq: int = 0):
+        self.content = content
+        self.role = role
+        self.timestamp = time.monotonic() if timestamp is None else timestamp
+        self.image_ref = image_ref
+        self.seq = seq  # position in the session, used to fold messages into the summary
+        self._openai: Optional[Dict] = None
+        self._tokens: Optional[int] = None
+    
+    @property
+    def message_type(self) -> MessageType:
+        return MessageType(self.role)
     
     def to_openai_format(self) -> Dict:
-        """Convert message to OpenAI API format"""
-        if self.message_type == MessageType.USER:
-            if self.image_base64:
+        """Convert message to OpenAI API format (shared dict, treat as read-only)"""
+        if self.image_ref:
+            # Not cached: the cached dict would pin the image after session_images evicts it
+            image_base64 = session_images.get(self.image_ref)
+            if image_base64:
                 return {
-                    "role": "user",
+                    "role": ROLE_USER,
                     "content": [
                         {"type": "text", "text": self.content},
                         {
                             "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{self.image_base64}"}
+                            "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
                         }
                     ]
                 }
-            else:
-                return {"role": "user", "content": self.content}
-        elif self.message_type == MessageType.ASSISTANT:
-            return {"role": "assistant", "content": self.content}
-        else:  # SYSTEM
-            return {"role": "system", "content": self.content}
+        if self._openai is None:
+            self._openai = {"role": self.role, "content": self.content}
+        return self._openai
+    
+    @property
+    def token_estimate(self) -> int:
+        """Estimated prompt tokens of this message as sent with its image"""
+        if self._tokens is None:
+            text_form = {"role": self.role, "content": self.content}
+            if self.image_ref:
+                text_form["content"] = [{"type": "text", "text": self.content}, {"type": "image_url"}]
+            self._tokens = estimate_message_tokens(text_form)
+        return self._tokens
 
 class ConversationSession:
     """Manages a single user's conversation session"""
@@ -49,6 +127,12 @@ class ConversationSession:
         self.session_timeout = session_timeout  # in seconds (1 hour = 3600)
         self.last_activity = datetime.now()
         self.created_at = datetime.now()
+        # Monotonic deadline, so expiry checks and the store's expiry wheel avoid wall-clock math
+        self.expires_at = time.monotonic() + session_timeout
+        self.summary = ""  # running summary of messages folded out of the live history
+        self.summarized_count = 0
+        self.revision = 0  # bumped on every change, so snapshots only re-serialize changed sessions
+        self._next_seq = 1
         self._lock = threading.Lock()
     
     def add_message(self, content: str, message_type: MessageType, image_base64: Optional[str] = None):
@@ -56,151 +140,295 @@ class ConversationSession:
         with self._lock:
             message = Message(
                 content=content,
-                message_type=message_type,
-                timestamp=datetime.now(),
-                image_base64=image_base64
+                role=ROLES[message_type],
+                image_ref=session_images.put(image_base64) if image_base64 else None,
+                seq=self._next_seq
             )
+            self._next_seq += 1
+            self.revision += 1
             
             self.messages.append(message)
             self.last_activity = datetime.now()
+            self.expires_at = time.monotonic() + self.session_timeout
             
             # Implement FIFO: Remove oldest messages if limit exceeded
             if len(self.messages) > self.max_messages:
                 # Keep system message if it's the first one
-                if self.messages[0].message_type == MessageType.SYSTEM:
+                if self.messages[0].role is ROLE_SYSTEM:
                     # Remove the second oldest message instead
                     self.messages.pop(1)
                 else:
                     # Remove the oldest message
                     self.messages.pop(0)
     
+    def get_messages(self) -> List[Message]:
+        """Snapshot of the live messages, oldest first"""
+        with self._lock:
+            return list(self.messages)
+    
     def get_messages_for_ai(self) -> List[Dict]:
         """Get messages in OpenAI API format"""
         with self._lock:
             return [msg.to_openai_format() for msg in self.messages]
     
+    def get_messages_to_summarize(self, keep_recent: int) -> List[Message]:
+        """Messages older than the last keep_recent ones, oldest first"""
+        with self._lock:
+            if len(self.messages) <= keep_recent:
+                return []
+            return list(self.messages[:-keep_recent])
+    
+    def apply_summary(self, summary: str, through_seq: int):
+        """Replace the running summary and drop the messages it now covers"""
+        with self._lock:
+            remaining = [msg for msg in self.messages if msg.seq > through_seq]
+            self.summarized_count += len(self.messages) - len(remaining)
+            self.messages = remaining
+            self.summary = summary
+            self.revision += 1
+    
+    def to_dict(self) -> Dict:
+        """Serializable form for shared session stores; images are persisted as references only"""
+        with self._lock:
+            return {
+                "user_id": self.user_id,
+                "max_messages": self.max_messages,
+                "session_timeout": self.session_timeout,
+                "created_at": self.created_at.isoformat(),
+                "last_activity": self.last_activity.isoformat(),
+                "summary": self.summary,
+                "summarized_count": self.summarized_count,
+                "next_seq": self._next_seq,
+                "messages": [
+                    {
+                        "content": msg.content,
+                        "type": msg.role,
+                        "timestamp": round(_monotonic_to_epoch(msg.timestamp), 3),
+                        "image_ref": msg.image_ref,
+                        "seq": msg.seq
+                    }
+                    for msg in self.messages
+                ]
+            }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ConversationSession":
+        """Rebuild a session from to_dict() output"""
+        session = cls(data["user_id"], data["max_messages"], data["session_timeout"])
+        session.created_at = datetime.fromisoformat(data["created_at"])
+        session.last_activity = datetime.fromisoformat(data["last_activity"])
+        idle_seconds = (datetime.now() - session.last_activity).total_seconds()
+        session.expires_at = time.monotonic() + session.session_timeout - idle_seconds
+        session.summary = data.get("summary", "")
+        session.summarized_count = data.get("summarized_count", 0)
+        session._next_seq = data.get("next_seq", len(data["messages"]) + 1)
+        session.messages = [
+            Message(
+                content=msg["content"],
+                role=ROLES[MessageType(msg["type"])],
+                timestamp=_epoch_to_monotonic(msg["timestamp"]),
+                image_ref=msg.get("image_ref"),
+                seq=msg.get("seq", 0)
+            )
+            for msg in data["messages"]
+        ]
+        return session
+    
     def is_expired(self) -> bool:
         """Check if session has expired"""
-        return datetime.now() - self.last_activity > timedelta(seconds=self.session_timeout)
+        return time.monotonic() >= self.expires_at
     
     def get_session_info(self) -> Dict:
         """Get session information"""
         with self._lock:
             return {
                 "user_id": self.user_id,
-                "message_count": len(self.messages),
+                "message_count": self.summarized_count + len(self.messages),
+                "live_messages": len(self.messages),
+                "summarized_messages": self.summarized_count,
                 "created_at": self.created_at.isoformat(),
                 "last_activity": self.last_activity.isoformat(),
                 "is_expired": self.is_expired(),
-                "time_remaining": max(0, self.session_timeout - (datetime.now() - self.last_activity).total_seconds())
+                "time_remaining": max(0, self.expires_at - time.monotonic())
             }
 
 class SessionManager:
     """Manages all user sessions with automatic cleanup"""
     
-    def __init__(self, max_messages_per_session: int = 30, session_timeout: int = 3600, cleanup_interval: int = 300):
-        self.sessions: Dict[str, ConversationSession] = {}
+    def __init__(self, max_messages_per_session: int = 30, session_timeout: int = 3600, cleanup_interval: float = 5.0,
+                 context_token_budget: int = 6000, store: Optional[SessionStore] = None):
+        self.store = store or MemorySessionStore()
         self.max_messages_per_session = max_messages_per_session
         self.session_timeout = session_timeout
-        self.cleanup_interval = cleanup_interval  # cleanup every 5 minutes
-        self._lock = threading.Lock()
+        self.cleanup_interval = cleanup_interval  # seconds between expiry passes (each is O(expired))
+        self.context_builder = ContextBuilder(token_budget=context_token_budget)
+        # Snapshot records read at startup but not hydrated yet (user_id -> to_dict() output)
+        self._pending_restore: Dict[str, Dict] = {}
+        self._restore_stats = {"queued": 0, "restored": 0, "restored_on_demand": 0, "skipped": 0}
         
         # Start cleanup thread
         self._cleanup_thread = threading.Thread(target=self._cleanup_expired_sessions, daemon=True)
         self._cleanup_thread.start()
         
-        print(f"[SESSION_MANAGER] Started with {max_messages_per_session} max messages, {session_timeout/60:.1f}min timeout")
+        print(f"[SESSION_MANAGER] Started with {max_messages_per_session} max messages, {session_timeout/60:.1f}min timeout "
+              f"({self.store.backend} store)")
     
-    def get_or_create_session(self, user_id: str) -> ConversationSession:
+    async def get_or_create_session(self, user_id: str) -> ConversationSession:
         """Get existing session or create new one"""
-        with self._lock:
-            # Check if session exists and is not expired
-            if user_id in self.sessions:
-                session = self.sessions[user_id]
-                if not session.is_expired():
-                    return session
-                else:
-                    # Session expired, remove it
-                    del self.sessions[user_id]
-                    print(f"[SESSION_MANAGER] Expired session removed for user: {user_id}")
-            
-            # Create new session
-            session = ConversationSession(
-                user_id=user_id,
-                max_messages=self.max_messages_per_session,
-                session_timeout=self.session_timeout
-            )
-            self.sessions[user_id] = session
-            print(f"[SESSION_MANAGER] New session created for user: {user_id}")
+        # Check if session exists and is not expired
+        session = await self.store.load(user_id)
+        if session is not None:
+            if not session.is_expired():
+                return session
+            else:
+                # Session expired, remove it
+                await self.store.delete(user_id)
+                print(f"[SESSION_MANAGER] Expired session removed for user: {user_id}")
+        
+        # Create new session (atomic per user, so concurrent first messages share one session)
+        session, _ = await self.store.get_or_create(user_id, lambda: self._new_session(user_id))
+        return session
+    
+    def _new_session(self, user_id: str) -> ConversationSession:
+        """A session restored from the last snapshot if there is one, otherwise an empty one"""
+        restored = self._take_restored(user_id)
+        if restored is not None:
+            self._restore_stats["restored_on_demand"] += 1
+            print(f"[SESSION_MANAGER] Session restored from snapshot for user: {user_id}")
+            return restored
+        print(f"[SESSION_MANAGER] New session created for user: {user_id}")
+        return ConversationSession(
+            user_id=user_id,
+            max_messages=self.max_messages_per_session,
+            session_timeout=self.session_timeout
+        )
+    
+    async def queue_restore(self, records: List[Dict]):
+        """Queue snapshot records for lazy restore; users who already have a live session are skipped"""
+        for record in records:
+            user_id = record.get("user_id")
+            if not user_id or await self.store.load(user_id) is not None:
+                self._restore_stats["skipped"] += 1
+                continue
+            self._pending_restore[user_id] = record
+            self._restore_stats["queued"] += 1
+    
+    async def restore_pending(self, limit: int) -> int:
+        """Hydrate up to `limit` queued sessions; returns how many were processed"""
+        processed = 0
+        while self._pending_restore and processed < limit:
+            user_id = next(iter(self._pending_restore))
+            processed += 1
+            restored = self._take_restored(user_id)
+            if restored is None:
+                continue
+            _, created = await self.store.get_or_create(user_id, lambda: restored)
+            if created:
+                self._restore_stats["restored"] += 1
+        return processed
+    
+    def _take_restored(self, user_id: str) -> Optional[ConversationSession]:
+        record = self._pending_restore.pop(user_id, None)
+        if record is None:
+            return None
+        try:
+            session = ConversationSession.from_dict(record)
+        except (ValueError, KeyError) as e:
+            print(f"[SESSION_MANAGER] Unreadable snapshot for {user_id}: {e}")
+            self._restore_stats["skipped"] += 1
+            return None
+        if session.is_expired():
+            self._restore_stats["skipped"] += 1
+            return None
+        return session
+    
+    def get_pending_restore(self) -> List[Dict]:
+        """Snapshot records not restored yet"""
+        return list(self._pending_restore.values())
+    
+    def get_restore_stats(self) -> Dict:
+        """Get warm-restore progress"""
+        return {"pending": len(self._pending_restore), **self._restore_stats}
+    
+    async def get_session(self, user_id: str) -> Optional[ConversationSession]:
+        """Get a live session without creating one"""
+        session = await self.store.load(user_id)
+        if session and not session.is_expired():
             return session
+        return None
     
-    def add_message(self, user_id: str, content: str, message_type: MessageType, image_base64: Optional[str] = None):
-        """Add message to user's session"""
-        session = self.get_or_create_session(user_id)
-        session.add_message(content, message_type, image_base64)
+    async def add_message(self, user_id: str, content: str, message_type: MessageType,
+                          image_base64: Optional[str] = None) -> ConversationSession:
+        """Add message to user's session (a read-modify-write the store keeps safe across workers)"""
+        session = await self.store.update(
+            user_id,
+            lambda current: current.add_message(content, message_type, image_base64),
+            lambda: self._new_session(user_id)
+        )
         print(f"[SESSION_MANAGER] Message added for {user_id}: {message_type.value} ({len(session.messages)} total)")
+        return session
     
-    def get_conversation_context(self, user_id: str, system_prompt: str) -> List[Dict]:
-        """Get full conversation context for AI, including system prompt"""
-        session = self.get_or_create_session(user_id)
-        messages = session.get_messages_for_ai()
+    async def apply_summary(self, user_id: str, summary: str, through_seq: int) -> bool:
+        """Store a new running summary for a user's session; False if the session is gone"""
+        session = await self.store.update(user_id, lambda current: current.apply_summary(summary, through_seq))
+        return session is not None
+    
+    async def get_conversation_context(self, user_id: str, system_prompt: str) -> List[Dict]:
+        """Get conversation context for AI within the token budget, system prompt first"""
+        session = await self.get_or_create_session(user_id)
+        messages = session.get_messages()
         
-        # Always ensure system message is first
-        if not messages or messages[0].get("role") != "system":
-            messages.insert(0, {"role": "system", "content": system_prompt})
+        # A system message stored in the session takes precedence over the caller's
+        if messages and messages[0].role is ROLE_SYSTEM:
+            system_prompt = messages.pop(0).content
         
-        return messages
+        context, report = self.context_builder.build(system_prompt, messages, session.summary)
+        if report["tokens_saved"]:
+            print(f"[SESSION_MANAGER] Context for {user_id}: ~{report['tokens_sent']} tokens "
+                  f"(saved ~{report['tokens_saved']}, {report['images_replaced']} images replaced, "
+                  f"{report['messages_dropped']} messages dropped)")
+        return context
     
-    def get_session_info(self, user_id: str) -> Optional[Dict]:
+    async def get_session_info(self, user_id: str) -> Optional[Dict]:
         """Get session information for a user"""
-        with self._lock:
-            if user_id in self.sessions:
-                return self.sessions[user_id].get_session_info()
-            return None
+        session = await self.store.load(user_id)
+        if session is not None:
+            return session.get_session_info()
+        return None
     
-    def clear_session(self, user_id: str) -> bool:
+    async def clear_session(self, user_id: str) -> bool:
         """Manually clear a user's session"""
-        with self._lock:
-            if user_id in self.sessions:
-                del self.sessions[user_id]
-                print(f"[SESSION_MANAGER] Session manually cleared for user: {user_id}")
-                return True
-            return False
+        if await self.store.delete(user_id):
+            print(f"[SESSION_MANAGER] Session manually cleared for user: {user_id}")
+            return True
+        return False
     
-    def get_active_sessions_count(self) -> int:
+    async def get_active_sessions_count(self) -> int:
         """Get count of active sessions"""
-        with self._lock:
-            return len(self.sessions)
+        return await self.store.count()
     
-    def get_all_sessions_info(self) -> Dict:
+    async def get_all_sessions_info(self) -> Dict:
         """Get information about all active sessions"""
-        with self._lock:
-            return {
-                "active_sessions": len(self.sessions),
-                "sessions": {
-                    user_id: session.get_session_info() 
-                    for user_id, session in self.sessions.items()
-                }
-            }
+        sessions = {}
+        for user_id in await self.store.user_ids():
+            info = await self.get_session_info(user_id)
+            if info is not None:
+                sessions[user_id] = info
+        return {
+            "active_sessions": len(sessions),
+            "backend": self.store.backend,
+            "sessions": sessions
+        }
     
     def _cleanup_expired_sessions(self):
         """Background thread to cleanup expired sessions"""
         while True:
             try:
                 time.sleep(self.cleanup_interval)
-                expired_users = []
+                expired_users = self.store.remove_expired()
                 
-                with self._lock:
-                    for user_id, session in self.sessions.items():
-                        if session.is_expired():
-                            expired_users.append(user_id)
-                
-                # Remove expired sessions
                 for user_id in expired_users:
-                    with self._lock:
-                        if user_id in self.sessions:
-                            del self.sessions[user_id]
-                            print(f"[SESSION_MANAGER] Expired session cleaned up for user: {user_id}")
+                    print(f"[SESSION_MANAGER] Expired session cleaned up for user: {user_id}")
                 
                 if expired_users:
                     print(f"[SESSION_MANAGER] Cleaned up {len(expired_users)} expired sessions")
@@ -210,52 +438,63 @@ class SessionManager:
 
 # Global session manager instance
 session_manager = SessionManager(
-    max_messages_per_session=30,
-    session_timeout=3600,  # 1 hour
-    cleanup_interval=300   # cleanup every 5 minutes
+    max_messages_per_session=settings.SESSION_MAX_MESSAGES,
+    session_timeout=settings.SESSION_TIMEOUT,  # 1 hour
+    cleanup_interval=settings.SESSION_EXPIRY_TICK,
+    context_token_budget=settings.CONTEXT_TOKEN_BUDGET,
+    store=create_session_store(
+        settings.SESSION_BACKEND,
+        ConversationSession.from_dict,
+        ttl=settings.SESSION_TIMEOUT,
+        redis_url=settings.REDIS_URL,
+        key_prefix=settings.SESSION_KEY_PREFIX,
+        shards=settings.SESSION_SHARDS,
+        expiry_tick=settings.SESSION_EXPIRY_TICK
+    )
 )
 
 # Utility functions for easy integration
-def add_user_message(user_id: str, content: str, image_base64: Optional[str] = None):
+async def add_user_message(user_id: str, content: str, image_base64: Optional[str] = None) -> ConversationSession:
     """Add user message to session"""
-    session_manager.add_message(user_id, content, MessageType.USER, image_base64)
+    return await session_manager.add_message(user_id, content, MessageType.USER, image_base64)
 
-def add_assistant_message(user_id: str, content: str):
+async def add_assistant_message(user_id: str, content: str) -> ConversationSession:
     """Add assistant message to session"""
-    session_manager.add_message(user_id, content, MessageType.ASSISTANT)
+    return await session_manager.add_message(user_id, content, MessageType.ASSISTANT)
 
-def get_conversation_history(user_id: str, system_prompt: str) -> List[Dict]:
+async def get_conversation_history(user_id: str, system_prompt: str) -> List[Dict]:
     """Get conversation history for AI model"""
-    return session_manager.get_conversation_context(user_id, system_prompt)
+    return await session_manager.get_conversation_context(user_id, system_prompt)
 
-def clear_user_session(user_id: str) -> bool:
+async def clear_user_session(user_id: str) -> bool:
     """Clear user's session"""
-    return session_manager.clear_session(user_id)
+    return await session_manager.clear_session(user_id)
 
-def get_session_status(user_id: str) -> Optional[Dict]:
+async def get_session_status(user_id: str) -> Optional[Dict]:
     """Get user's session status"""
-    return session_manager.get_session_info(user_id)
+    return await session_manager.get_session_info(user_id)
 
 # Example usage and testing functions
-if __name__ == "__main__":
-    # Test the session manager
-    print("Testing Session Manager...")
-    
+async def _demo():
     # Add some test messages
-    add_user_message("user1", "Hello, I have a problem with my tomatoes")
-    add_assistant_message("user1", "Hello! I can help you with tomato problems. What seems to be the issue?")
-    add_user_message("user1", "The leaves are turning yellow")
+    await add_user_message("user1", "Hello, I have a problem with my tomatoes")
+    await add_assistant_message("user1", "Hello! I can help you with tomato problems. What seems to be the issue?")
+    await add_user_message("user1", "The leaves are turning yellow")
     
     # Get conversation history
     system_prompt = "You are an agricultural expert assistant."
-    history = get_conversation_history("user1", system_prompt)
+    history = await get_conversation_history("user1", system_prompt)
     
     print(f"Conversation history for user1: {len(history)} messages")
     for msg in history:
         print(f"  {msg['role']}: {msg['content'][:50]}...")
     
     # Check session status
-    status = get_session_status("user1")
+    status = await get_session_status("user1")
     print(f"Session status: {status}")
-    
-    print("Session Manager test completed!")
\ No newline at end of file
+
+if __name__ == "__main__":
+    # Test the session manager
+    print("Testing Session Manager...")
+    asyncio.run(_demo())
+    print("Session Manager test completed!")
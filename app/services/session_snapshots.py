@@ -0,0 +1,270 @@
+"""
+Session Snapshot Service
+Periodically saves live in-memory sessions so a redeploy doesn't wipe every farmer's context,
+and restores them after startup without blocking the first requests.
+
+- "file":  one JSON line per session, rewritten atomically (unchanged sessions reuse their line)
+- "mongo": one document per session in session_snapshots, only changed sessions are written
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import DeleteOne, ReplaceOne
+
+from app.config import settings
+from app.services.mongo_db import db
+from app.services.session_manager import SessionManager, session_manager
+
+
+class SessionSnapshotter:
+    """Background snapshot loop plus incremental warm restore for a SessionManager"""
+
+    def __init__(self, manager: SessionManager, backend: str = "file", path: str = "data/session_snapshot.jsonl",
+                 interval: float = 60.0, restore_batch: int = 500):
+        self.manager = manager
+        self.backend = backend
+        self.path = path
+        self.interval = interval
+        self.restore_batch = restore_batch
+        self.collection = db["session_snapshots"]
+        # user_id -> (revision, serialized line) from the previous snapshot
+        self._snapshotted: Dict[str, Tuple[int, str]] = {}
+        # Byte offset of the first snapshot-file line not yet queued, while the restore is reading it
+        self._restore_offset: Optional[int] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stats = {"snapshots": 0, "failed": 0, "sessions": 0, "written": 0, "last_ms": 0.0, "restore_ms": 0.0,
+                       "deferred": 0}
+
+    def is_enabled(self) -> bool:
+        # Shared stores (Redis) already outlive the process
+        return self.backend in ("file", "mongo") and self.manager.store.backend == "memory"
+
+    async def start(self):
+        """Start the warm restore and the periodic snapshot loop"""
+        if not self.is_enabled() or self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._restore(), name="session-restore"),
+            asyncio.create_task(self._snapshot_loop(), name="session-snapshots")
+        ]
+        print(f"[SNAPSHOT] Session snapshots every {self.interval:.0f}s to {self.backend}")
+
+    async def stop(self):
+        """Stop the loop and take a final snapshot before the process exits"""
+        if not self._tasks:
+            return
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if not await self._queue_unread_tail():
+            print("[SNAPSHOT] Keeping the previous snapshot file: its unread part could not be carried over")
+            return
+        await self.snapshot()
+
+    async def snapshot(self):
+        """Write one snapshot of every live session"""
+        if self.backend == "file" and self._restore_offset is not None:
+            # Rewriting the file now would drop the lines the restore hasn't read yet
+            self._stats["deferred"] += 1
+            return
+
+        started = time.perf_counter()
+        try:
+            sessions, pending = await self._collect()
+            current, changed, lines = await asyncio.to_thread(self._encode, sessions, pending, self._snapshotted)
+            removed = [user_id for user_id in self._snapshotted if user_id not in current]
+            if self.backend == "file":
+                await asyncio.to_thread(self._write_file, lines)
+            else:
+                await self._write_mongo(changed, removed)
+            self._snapshotted = current
+        except Exception as e:
+            self._stats["failed"] += 1
+            print(f"[SNAPSHOT] Snapshot failed: {e}")
+            return
+
+        elapsed = time.perf_counter() - started
+        self._stats["snapshots"] += 1
+        self._stats["sessions"] = len(lines)
+        self._stats["written"] += len(changed)
+        self._stats["last_ms"] = round(elapsed * 1000, 2)
+        if changed or removed:
+            print(f"[SNAPSHOT] {len(lines)} sessions ({len(changed)} changed, {len(removed)} removed) "
+                  f"in {elapsed * 1000:.0f}ms")
+
+    def get_stats(self) -> Dict:
+        """Get snapshot counters and warm-restore progress"""
+        return {
+            "enabled": self.is_enabled(),
+            "backend": self.backend,
+            "interval_seconds": self.interval,
+            **self._stats,
+            "restore": self.manager.get_restore_stats()
+        }
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.snapshot()
+
+    async def _collect(self) -> Tuple[List[Tuple[str, int, Optional[Dict]]], List[Dict]]:
+        """
+        Runs on the event loop, so sessions aren't read while they are being changed: returns
+        (user_id, revision, to_dict() or None if unchanged since the last snapshot) per live
+        session, plus the snapshot records still waiting to be restored.
+        """
+        sessions: List[Tuple[str, int, Optional[Dict]]] = []
+        for user_id in await self.manager.store.user_ids():
+            session = await self.manager.store.load(user_id)
+            if session is None or session.is_expired():
+                continue
+            previous = self._snapshotted.get(user_id)
+            unchanged = previous is not None and previous[0] == session.revision
+            sessions.append((user_id, session.revision, None if unchanged else session.to_dict()))
+        return sessions, self.manager.get_pending_restore()
+
+    @staticmethod
+    def _encode(sessions: List[Tuple[str, int, Optional[Dict]]], pending: List[Dict],
+                previous: Dict[str, Tuple[int, str]]) -> Tuple[Dict[str, Tuple[int, str]], Dict[str, str], List[str]]:
+        """JSON-encode collected sessions (in a worker thread); unchanged ones reuse their previous line"""
+        current: Dict[str, Tuple[int, str]] = {}
+        changed: Dict[str, str] = {}
+        for user_id, revision, record in sessions:
+            if record is None:
+                current[user_id] = previous[user_id]
+                continue
+            line = json.dumps(record, ensure_ascii=False)
+            current[user_id] = (revision, line)
+            changed[user_id] = line
+
+        lines = [line for _, line in current.values()]
+        # Records still waiting to be restored must survive into the next snapshot file
+        lines += [json.dumps(record, ensure_ascii=False) for record in pending]
+        return current, changed, lines
+
+    def _write_file(self, lines: List[str]):
+        # Write to a temp file and rename so a crash never leaves a partial snapshot
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for line in lines:
+                f.write(line + "\n")
+        os.replace(tmp_path, self.path)
+
+    async def _write_mongo(self, changed: Dict[str, str], removed: List[str]):
+        operations = [
+            ReplaceOne({"_id": user_id}, {"_id": user_id, "session": line, "saved_at": time.time()}, upsert=True)
+            for user_id, line in changed.items()
+        ]
+        operations += [DeleteOne({"_id": user_id}) for user_id in removed]
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+
+    async def _restore(self):
+        """Read the last snapshot in batches, queue it for on-demand restore, then hydrate it gradually"""
+        started = time.perf_counter()
+        try:
+            if self.backend == "file":
+                await self._read_file_batches()
+            else:
+                await self._read_mongo_batches()
+
+            # Farmers who write first are restored on demand; the rest are hydrated a batch at a time
+            while await self.manager.restore_pending(self.restore_batch):
+                await asyncio.sleep(0)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[SNAPSHOT] Warm restore failed: {e}")
+            # Try once more to queue the rest of the file so later snapshots don't lose it
+            await self._queue_unread_tail()
+            return
+
+        self._stats["restore_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        stats = self.manager.get_restore_stats()
+        print(f"[SNAPSHOT] Warm restore done: {stats['restored']} restored in the background, "
+              f"{stats['restored_on_demand']} on demand, {stats['skipped']} skipped")
+
+    async def _read_file_batches(self):
+        if not os.path.exists(self.path):
+            return
+        self._restore_offset = 0
+        with open(self.path, "rb") as f:
+            while True:
+                lines, size = await asyncio.to_thread(self._read_lines, f, self.restore_batch)
+                if not lines:
+                    break
+                await self.manager.queue_restore(self._parse(lines))
+                self._restore_offset += size
+                await asyncio.sleep(0)
+        self._restore_offset = None
+
+    async def _queue_unread_tail(self) -> bool:
+        """Queue whatever a cancelled file restore never read, so the final snapshot keeps it"""
+        if self._restore_offset is None:
+            return True
+        try:
+            lines = await asyncio.to_thread(self._read_tail, self.path, self._restore_offset)
+            await self.manager.queue_restore(self._parse(lines))
+        except Exception as e:
+            print(f"[SNAPSHOT] Reading the unrestored snapshot lines failed: {e}")
+            return False
+        print(f"[SNAPSHOT] Carried {len(lines)} unrestored snapshot lines into the final snapshot")
+        self._restore_offset = None
+        return True
+
+    async def _read_mongo_batches(self):
+        cursor = self.collection.find({}, {"session": 1}).batch_size(self.restore_batch)
+        batch: List[str] = []
+        async for doc in cursor:
+            batch.append(doc.get("session", ""))
+            if len(batch) >= self.restore_batch:
+                await self.manager.queue_restore(self._parse(batch))
+                batch = []
+        if batch:
+            await self.manager.queue_restore(self._parse(batch))
+
+    @staticmethod
+    def _read_lines(f, count: int) -> Tuple[List[bytes], int]:
+        """Up to count lines and the number of bytes they span"""
+        lines = []
+        size = 0
+        for line in f:
+            lines.append(line)
+            size += len(line)
+            if len(lines) >= count:
+                break
+        return lines, size
+
+    @staticmethod
+    def _read_tail(path: str, offset: int) -> List[bytes]:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            return f.readlines()
+
+    @staticmethod
+    def _parse(lines: List) -> List[Dict]:
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        return records
+
+
+# Global session snapshotter instance
+session_snapshotter = SessionSnapshotter(
+    session_manager,
+    backend=settings.SESSION_SNAPSHOT_BACKEND,
+    path=settings.SESSION_SNAPSHOT_PATH,
+    interval=settings.SESSION_SNAPSHOT_INTERVAL,
+    restore_batch=settings.SESSION_RESTORE_BATCH
+)
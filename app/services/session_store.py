@@ -0,0 +1,403 @@
+"""
+Session Store Service
+Pluggable storage behind SessionManager, so several uvicorn workers or containers
+can share conversation state.
+
+- "memory": live session objects in this process, sharded (single worker)
+- "redis":  JSON sessions in Redis with a TTL refreshed on every write
+- "local":  in-process stand-in that serializes exactly like the Redis store (tests)
+"""
+
+import json
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class SessionStore:
+    """
+    Base class for session backends; sessions are ConversationSession objects.
+    Methods are coroutines so network backends never block the event loop.
+    """
+
+    backend = "base"
+
+    async def load(self, user_id: str):
+        """Return the user's session, or None if there is none"""
+        raise NotImplementedError
+
+    async def save(self, session):
+        """Persist a session after it was created or changed"""
+        raise NotImplementedError
+
+    async def get_or_create(self, user_id: str, factory: Callable[[], object]) -> Tuple[object, bool]:
+        """Return (session, created), storing factory() if the user has no session"""
+        raise NotImplementedError
+
+    async def update(self, user_id: str, mutate: Callable[[object], None],
+                     factory: Optional[Callable[[], object]] = None):
+        """
+        Apply mutate(session) to the user's live session and persist it, without losing a
+        concurrent writer's change. A missing or expired session is replaced by factory(),
+        or None is returned when there is no factory.
+        """
+        session = await self.load(user_id)
+        if session is not None and session.is_expired():
+            await self.delete(user_id)
+            session = None
+        if session is None:
+            if factory is None:
+                return None
+            session, _ = await self.get_or_create(user_id, factory)
+        mutate(session)
+        await self.save(session)
+        return session
+
+    async def delete(self, user_id: str) -> bool:
+        """Remove a session; True if one existed"""
+        raise NotImplementedError
+
+    async def user_ids(self) -> List[str]:
+        """All users with a stored session"""
+        raise NotImplementedError
+
+    async def count(self) -> int:
+        return len(await self.user_ids())
+
+    def remove_expired(self) -> List[str]:
+        """Drop expired sessions and return their user ids (no-op where the backend expires keys itself)"""
+        return []
+
+    def get_stats(self) -> Dict:
+        """Get backend-specific counters"""
+        return {"backend": self.backend}
+
+
+class ExpiryWheel:
+    """
+    Hashed timer wheel of session deadlines. Each user has one live entry; when it fires,
+    the caller either expires the session or reschedules it at its current deadline,
+    so a pass costs O(sessions due) rather than O(all sessions).
+    """
+
+    def __init__(self, tick: float = 5.0, slots: int = 1024):
+        self.tick = tick
+        self.slots = slots
+        self._buckets: List[List[Tuple[str, int]]] = [[] for _ in range(slots)]
+        self._scheduled: Dict[str, int] = {}  # user_id -> tick of its live entry
+        self._cursor = int(time.monotonic() // tick)
+        self._lock = threading.Lock()
+
+    def schedule(self, user_id: str, deadline: float):
+        """(Re)schedule a user; any earlier entry becomes stale and is skipped when it fires"""
+        with self._lock:
+            # Clamped under the lock, so advance() can't move past due_tick before it is bucketed
+            due_tick = max(int(deadline // self.tick), self._cursor)
+            self._scheduled[user_id] = due_tick
+            self._buckets[due_tick % self.slots].append((user_id, due_tick))
+
+    def cancel(self, user_id: str):
+        with self._lock:
+            self._scheduled.pop(user_id, None)
+
+    def advance(self, now: float) -> List[str]:
+        """Pop every live entry due up to now"""
+        due: List[str] = []
+        now_tick = int(now // self.tick)
+        with self._lock:
+            # After a long stall one full revolution visits every bucket
+            for current in range(max(self._cursor, now_tick - self.slots + 1), now_tick + 1):
+                bucket = self._buckets[current % self.slots]
+                if not bucket:
+                    continue
+                later = []
+                for user_id, due_tick in bucket:
+                    if self._scheduled.get(user_id) != due_tick:
+                        continue  # stale entry
+                    if due_tick > now_tick:
+                        later.append((user_id, due_tick))  # due on a later revolution
+                        continue
+                    del self._scheduled[user_id]
+                    due.append(user_id)
+                self._buckets[current % self.slots] = later
+            self._cursor = now_tick + 1
+        return due
+
+    def __len__(self) -> int:
+        return len(self._scheduled)
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Live session objects in this process, split across shards with one lock each.
+    Reads take no lock; writes only lock their own shard. Expiry runs off an ExpiryWheel.
+    """
+
+    backend = "memory"
+
+    def __init__(self, shards: int = 64, expiry_tick: float = 5.0, max_timeout: int = 3600):
+        self._shards: List[Dict[str, object]] = [{} for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        slots = max(64, int(max_timeout // expiry_tick) + 2)
+        self._wheel = ExpiryWheel(tick=expiry_tick, slots=slots)
+        self._stats = {"expiry_passes": 0, "expired": 0, "rescheduled": 0}
+
+    def _shard(self, user_id: str) -> int:
+        return hash(user_id) % len(self._shards)
+
+    async def load(self, user_id: str):
+        # Single dict lookups are atomic under the GIL, so reads skip the shard lock
+        return self._shards[self._shard(user_id)].get(user_id)
+
+    async def save(self, session):
+        # Sessions are mutated in place; only a new object needs storing and scheduling
+        index = self._shard(session.user_id)
+        with self._locks[index]:
+            if self._shards[index].get(session.user_id) is session:
+                return
+            self._shards[index][session.user_id] = session
+        self._wheel.schedule(session.user_id, session.expires_at)
+
+    async def get_or_create(self, user_id: str, factory: Callable[[], object]) -> Tuple[object, bool]:
+        index = self._shard(user_id)
+        with self._locks[index]:
+            session = self._shards[index].get(user_id)
+            if session is not None:
+                return session, False
+            session = self._shards[index][user_id] = factory()
+        self._wheel.schedule(user_id, session.expires_at)
+        return session, True
+
+    async def delete(self, user_id: str) -> bool:
+        index = self._shard(user_id)
+        with self._locks[index]:
+            removed = self._shards[index].pop(user_id, None) is not None
+        if removed:
+            self._wheel.cancel(user_id)
+        return removed
+
+    async def user_ids(self) -> List[str]:
+        return [user_id for shard in self._shards for user_id in list(shard)]
+
+    async def count(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    def remove_expired(self) -> List[str]:
+        now = time.monotonic()
+        expired = []
+        for user_id in self._wheel.advance(now):
+            index = self._shard(user_id)
+            with self._locks[index]:
+                session = self._shards[index].get(user_id)
+                if session is None:
+                    continue
+                if session.expires_at <= now:
+                    del self._shards[index][user_id]
+                    expired.append(user_id)
+                    continue
+            # Active since it was scheduled: move the entry to the current deadline
+            self._wheel.schedule(user_id, session.expires_at)
+            self._stats["rescheduled"] += 1
+
+        self._stats["expiry_passes"] += 1
+        self._stats["expired"] += len(expired)
+        return expired
+
+    def get_stats(self) -> Dict:
+        """Get shard sizes and expiry-wheel counters"""
+        sizes = [len(shard) for shard in self._shards]
+        return {
+            "backend": self.backend,
+            "shards": len(sizes),
+            "sessions": sum(sizes),
+            "largest_shard": max(sizes) if sizes else 0,
+            "scheduled": len(self._wheel),
+            **self._stats
+        }
+
+
+class SerializedSessionStore(SessionStore):
+    """Base for stores that keep sessions as JSON; every load returns a fresh copy"""
+
+    def __init__(self, session_from_dict: Callable[[Dict], object], ttl: int):
+        self.session_from_dict = session_from_dict
+        self.ttl = ttl
+
+    async def load(self, user_id: str):
+        raw = await self._get(user_id)
+        session = self._decode(user_id, raw)
+        if session is None and raw is not None:
+            await self.delete(user_id)
+        return session
+
+    async def save(self, session):
+        await self._set(session.user_id, self._encode(session))
+
+    def _encode(self, session) -> str:
+        return json.dumps(session.to_dict(), ensure_ascii=False)
+
+    def _decode(self, user_id: str, raw: Optional[str]):
+        if raw is None:
+            return None
+        try:
+            return self.session_from_dict(json.loads(raw))
+        except (ValueError, KeyError) as e:
+            print(f"[SESSION_STORE] Discarding unreadable session for {user_id}: {e}")
+            return None
+
+    async def _get(self, user_id: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def _set(self, user_id: str, raw: str):
+        raise NotImplementedError
+
+
+class RedisSessionStore(SerializedSessionStore):
+    """
+    Sessions in Redis under prefix+user_id, expiring ttl seconds after the last write.
+    Uses the asyncio client, creates sessions with SET NX and applies updates in a
+    WATCH/MULTI transaction retried on conflict, so concurrent workers never overwrite
+    each other's messages.
+    """
+
+    backend = "redis"
+
+    def __init__(self, url: str, session_from_dict: Callable[[Dict], object], ttl: int,
+                 key_prefix: str = "whatsapp-bot:session:", max_retries: int = 10):
+        super().__init__(session_from_dict, ttl)
+        # Imported here so in-memory deployments don't need the redis package
+        import redis.asyncio as redis
+        from redis.exceptions import WatchError
+        self.client = redis.Redis.from_url(url, decode_responses=True, socket_timeout=2.0)
+        self._watch_error = WatchError
+        self.key_prefix = key_prefix
+        self.max_retries = max_retries
+        self._stats = {"created": 0, "create_races": 0, "updates": 0, "update_conflicts": 0}
+
+    def _key(self, user_id: str) -> str:
+        return f"{self.key_prefix}{user_id}"
+
+    async def _get(self, user_id: str) -> Optional[str]:
+        return await self.client.get(self._key(user_id))
+
+    async def _set(self, user_id: str, raw: str):
+        await self.client.set(self._key(user_id), raw, ex=self.ttl)
+
+    async def get_or_create(self, user_id: str, factory: Callable[[], object]) -> Tuple[object, bool]:
+        session = await self.load(user_id)
+        if session is not None:
+            return session, False
+        created = factory()
+        raw = self._encode(created)
+        for _ in range(self.max_retries):
+            # NX: only the first worker to create the session wins; the others load its copy
+            if await self.client.set(self._key(user_id), raw, ex=self.ttl, nx=True):
+                self._stats["created"] += 1
+                return created, True
+            self._stats["create_races"] += 1
+            session = await self.load(user_id)
+            if session is not None:
+                return session, False
+        raise RuntimeError(f"Could not create session for {user_id} after {self.max_retries} attempts")
+
+    async def update(self, user_id: str, mutate: Callable[[object], None],
+                     factory: Optional[Callable[[], object]] = None):
+        key = self._key(user_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            for _ in range(self.max_retries):
+                try:
+                    await pipe.watch(key)
+                    session = self._decode(user_id, await pipe.get(key))
+                    if session is None or session.is_expired():
+                        if factory is None:
+                            await pipe.unwatch()
+                            return None
+                        session = factory()
+                    mutate(session)
+                    pipe.multi()
+                    pipe.set(key, self._encode(session), ex=self.ttl)
+                    await pipe.execute()
+                    self._stats["updates"] += 1
+                    return session
+                except self._watch_error:
+                    # Another worker wrote the session since WATCH; re-read and re-apply
+                    self._stats["update_conflicts"] += 1
+                    await pipe.reset()
+        raise RuntimeError(f"Session update for {user_id} kept conflicting after {self.max_retries} attempts")
+
+    async def delete(self, user_id: str) -> bool:
+        return bool(await self.client.delete(self._key(user_id)))
+
+    async def user_ids(self) -> List[str]:
+        prefix_length = len(self.key_prefix)
+        return [key[prefix_length:] async for key in self.client.scan_iter(match=f"{self.key_prefix}*", count=500)]
+
+    def get_stats(self) -> Dict:
+        """Get create/update counters, including NX races and WATCH conflicts"""
+        return {"backend": self.backend, **self._stats}
+
+
+class LocalSessionStore(SerializedSessionStore):
+    """Redis stand-in for tests: same JSON round-trip and TTL semantics, no server"""
+
+    backend = "local"
+
+    def __init__(self, session_from_dict: Callable[[Dict], object], ttl: int):
+        super().__init__(session_from_dict, ttl)
+        self._data: Dict[str, tuple] = {}
+
+    async def _get(self, user_id: str) -> Optional[str]:
+        return self._get_now(user_id)
+
+    def _get_now(self, user_id: str) -> Optional[str]:
+        entry = self._data.get(user_id)
+        if entry is None:
+            return None
+        raw, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._data[user_id]
+            return None
+        return raw
+
+    async def _set(self, user_id: str, raw: str):
+        self._data[user_id] = (raw, time.monotonic() + self.ttl)
+
+    async def get_or_create(self, user_id: str, factory: Callable[[], object]) -> Tuple[object, bool]:
+        # No await between the read and the write, so this is atomic on the event loop
+        session = self._decode(user_id, self._get_now(user_id))
+        if session is not None:
+            return session, False
+        session = factory()
+        self._data[user_id] = (self._encode(session), time.monotonic() + self.ttl)
+        return session, True
+
+    async def update(self, user_id: str, mutate: Callable[[object], None],
+                     factory: Optional[Callable[[], object]] = None):
+        session = self._decode(user_id, self._get_now(user_id))
+        if session is None or session.is_expired():
+            if factory is None:
+                return None
+            session = factory()
+        mutate(session)
+        self._data[user_id] = (self._encode(session), time.monotonic() + self.ttl)
+        return session
+
+    async def delete(self, user_id: str) -> bool:
+        return self._data.pop(user_id, None) is not None
+
+    async def user_ids(self) -> List[str]:
+        now = time.monotonic()
+        return [user_id for user_id, (_, expires_at) in self._data.items() if expires_at > now]
+
+
+def create_session_store(backend: str, session_from_dict: Callable[[Dict], object], ttl: int,
+                         redis_url: str = "", key_prefix: str = "whatsapp-bot:session:",
+                         shards: int = 64, expiry_tick: float = 5.0) -> SessionStore:
+    """Create the configured session store ("memory", "redis" or "local")"""
+    if backend == "memory":
+        return MemorySessionStore(shards=shards, expiry_tick=expiry_tick, max_timeout=ttl)
+    if backend == "redis":
+        return RedisSessionStore(redis_url, session_from_dict, ttl, key_prefix)
+    if backend == "local":
+        return LocalSessionStore(session_from_dict, ttl)
+    raise ValueError(f"Unknown session store backend: {backend}")
@@ -0,0 +1,221 @@
+"""
+Webhook Queue Service
+Acknowledge-then-process pipeline for inbound WhatsApp messages.
+The webhook enqueues validated messages and a bounded pool of workers does the AI and outbound work.
+Messages from the same phone number are handled one at a time, in the order they arrived.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.config import settings
+
+
+@dataclass
+class InboundMessage:
+    """A validated inbound WhatsApp message waiting for background processing"""
+    phone_number: str
+    message: str
+    media_url: Optional[str] = None
+    message_sid: str = ""
+    received_at: float = field(default_factory=time.perf_counter)
+
+
+class StageStats:
+    """Running latency statistics for one processing stage"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def record(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            "max_ms": round(self.max * 1000, 2),
+            "last_ms": round(self.last * 1000, 2)
+        }
+
+
+class WebhookQueue:
+    """
+    Bounded queue of inbound messages drained by a fixed pool of asyncio workers.
+    A per-phone lock keeps each farmer's messages in order (a photo's analysis is saved
+    before the follow-up sent right after it is routed); different farmers run concurrently.
+    """
+
+    def __init__(self, worker_count: int = 4, max_size: int = 500, dedup_size: int = 5000):
+        self.worker_count = worker_count
+        self.max_size = max_size
+        self.dedup_size = dedup_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._handler: Optional[Callable[..., Awaitable]] = None
+        self._seen_sids: "OrderedDict[str, None]" = OrderedDict()
+        self._phone_locks: Dict[str, asyncio.Lock] = {}
+        self._phone_lock_users: Dict[str, int] = {}
+        self._busy_workers = 0
+        self._stages: Dict[str, StageStats] = {}
+        self._counters = {"enqueued": 0, "processed": 0, "failed": 0, "rejected": 0, "duplicates": 0,
+                          "ordered_waits": 0}
+
+    def is_running(self) -> bool:
+        """Check if the worker pool has been started"""
+        return bool(self._workers)
+
+    async def start(self, handler: Callable[..., Awaitable]):
+        """Start the worker pool; handler is awaited with (phone_number, message, media_url)"""
+        if self._workers:
+            return
+
+        self._handler = handler
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"webhook-worker-{i}")
+            for i in range(self.worker_count)
+        ]
+        print(f"[WEBHOOK_QUEUE] Started {self.worker_count} workers, queue size {self.max_size}")
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Drain queued messages (up to drain_timeout seconds) and stop the workers"""
+        if not self._workers:
+            return
+
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                print(f"[WEBHOOK_QUEUE] Drain timed out with {self._queue.qsize()} messages pending")
+
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        print("[WEBHOOK_QUEUE] Workers stopped")
+
+    def is_duplicate(self, message_sid: str) -> bool:
+        """Remember Twilio MessageSids so webhook retries are not processed twice"""
+        if not message_sid:
+            return False
+
+        if message_sid in self._seen_sids:
+            self._seen_sids.move_to_end(message_sid)
+            self._counters["duplicates"] += 1
+            return True
+
+        self._seen_sids[message_sid] = None
+        if len(self._seen_sids) > self.dedup_size:
+            self._seen_sids.popitem(last=False)
+        return False
+
+    def forget(self, message_sid: str):
+        """Drop a MessageSid so a Twilio retry of a rejected message is processed"""
+        self._seen_sids.pop(message_sid, None)
+
+    def enqueue(self, inbound: InboundMessage) -> bool:
+        """Add a message to the queue without waiting. Returns False if the queue is full."""
+        if self._queue is None:
+            return False
+
+        try:
+            self._queue.put_nowait(inbound)
+        except asyncio.QueueFull:
+            self._counters["rejected"] += 1
+            print(f"[WEBHOOK_QUEUE] Queue full, rejected message from {inbound.phone_number}")
+            return False
+
+        self._counters["enqueued"] += 1
+        return True
+
+    def depth(self) -> int:
+        """Number of messages waiting for a worker"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def record_stage(self, stage: str, seconds: float):
+        """Record the latency of one processing stage"""
+        stats = self._stages.get(stage)
+        if stats is None:
+            stats = self._stages[stage] = StageStats()
+        stats.record(seconds)
+
+    def get_stats(self) -> Dict:
+        """Get queue depth, worker utilisation and per-stage latency"""
+        return {
+            "async_mode": settings.WEBHOOK_ASYNC_MODE,
+            "running": self.is_running(),
+            "queue_depth": self.depth(),
+            "queue_max_size": self.max_size,
+            "worker_count": len(self._workers),
+            "busy_workers": self._busy_workers,
+            "phones_in_flight": len(self._phone_locks),
+            "counters": dict(self._counters),
+            "stages": {stage: stats.to_dict() for stage, stats in self._stages.items()}
+        }
+
+    @asynccontextmanager
+    async def _phone_lock(self, phone_number: str):
+        """Hold the phone's lock; it is dropped once no worker is using or waiting on it"""
+        lock = self._phone_locks.get(phone_number)
+        if lock is None:
+            lock = self._phone_locks[phone_number] = asyncio.Lock()
+        elif lock.locked():
+            self._counters["ordered_waits"] += 1
+        self._phone_lock_users[phone_number] = self._phone_lock_users.get(phone_number, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._phone_lock_users[phone_number] -= 1
+            if not self._phone_lock_users[phone_number]:
+                del self._phone_lock_users[phone_number]
+                del self._phone_locks[phone_number]
+
+    async def _worker(self, worker_id: int):
+        """Pull messages off the queue and run the handler for each one"""
+        while True:
+            inbound = await self._queue.get()
+            self._busy_workers += 1
+            started = time.perf_counter()
+            self.record_stage("queue_wait", started - inbound.received_at)
+
+            try:
+                async with self._phone_lock(inbound.phone_number):
+                    await self._handler(inbound.phone_number, inbound.message, inbound.media_url)
+                self._counters["processed"] += 1
+            except Exception as e:
+                self._counters["failed"] += 1
+                print(f"[WEBHOOK_QUEUE] Worker {worker_id} failed for {inbound.phone_number}: {e}")
+            finally:
+                self.record_stage("process", time.perf_counter() - started)
+                self._busy_workers -= 1
+                self._queue.task_done()
+
+
+# Global webhook queue instance
+webhook_queue = WebhookQueue(
+    worker_count=settings.WEBHOOK_WORKER_COUNT,
+    max_size=settings.WEBHOOK_QUEUE_SIZE
+)
+
+
+@contextmanager
+def track_stage(stage: str):
+    """Time a block of webhook processing and record it under the given stage name"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        webhook_queue.record_stage(stage, time.perf_counter() - started)
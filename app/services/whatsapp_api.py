@@ -1,5 +1,9 @@
+import asyncio
+from typing import Dict, Optional
+
 from twilio.rest import Client
 from app.config import settings
+from app.services.outbound_dispatcher import outbound_dispatcher
 
 # Twilio credentials (account SID and auth token)
 TWILIO_ACCOUNT_SID = settings.TWILIO_ACCOUNT_SID
@@ -9,6 +13,30 @@ TWILIO_PHONE_NUMBER = settings.TWILIO_PHONE_NUMBER
 # Twilio client setup
 client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
 
+# Last queued fallback send per recipient, so thread-pool sends keep their order
+_fallback_tails: Dict[str, asyncio.Task] = {}
+
+def _create_message(formatted_to: str, message: str) -> Optional[str]:
+    """Blocking Twilio REST call; returns the message SID, or None if sending failed"""
+    try:
+        return client.messages.create(
+            body=message,
+            from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
+            to=formatted_to
+        ).sid
+    except Exception as e:
+        print(f"[WHATSAPP] Send to {formatted_to} failed: {e}")
+        return None
+
+async def _send_after(previous: Optional[asyncio.Task], formatted_to: str, message: str) -> Optional[str]:
+    if previous is not None:
+        await asyncio.gather(previous, return_exceptions=True)
+    try:
+        return await asyncio.to_thread(_create_message, formatted_to, message)
+    finally:
+        if _fallback_tails.get(formatted_to) is asyncio.current_task():
+            del _fallback_tails[formatted_to]
+
 # Send message function to WhatsApp using Twilio
 def send_whatsapp_message(to: str, message: str):
     # Strip any accidental whitespace
@@ -23,11 +51,20 @@ def send_whatsapp_message(to: str, message: str):
 
     print(f"[DEBUG] Sending to: {formatted_to} | Message: {message}")  # Optional debug log
 
-    client.messages.create(
-        body=message,
-        from_=f"whatsapp:{TWILIO_PHONE_NUMBER}",
-        to=formatted_to
-    )
+    # Queue on the async dispatcher when it is running; it keeps per-recipient order and retries
+    if outbound_dispatcher.is_running():
+        return outbound_dispatcher.enqueue(formatted_to, message)
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # No event loop (scripts): nothing to block, send inline
+        return _create_message(formatted_to, message)
+
+    # Inside async handlers the blocking client runs in a worker thread, one send at a time per recipient
+    task = loop.create_task(_send_after(_fallback_tails.get(formatted_to), formatted_to, message))
+    _fallback_tails[formatted_to] = task
+    return task
 
 # Send image analysis result to WhatsApp
 def send_image_analysis_result(to: str, result: str):
@@ -0,0 +1,247 @@
+"""
+Write Buffer Service
+Write-behind buffer for message persistence. save_message queues the document and returns;
+a background flusher writes the queue with one insert_many per batch or time window,
+so reply chunks are no longer separated by database round trips.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, ConnectionFailure, ExecutionTimeout, PyMongoError, WTimeoutError
+
+from app.services.webhook_queue import StageStats
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def is_transient_error(error: Exception) -> bool:
+    """True for failures that say nothing about the documents (network, failover, timeouts)"""
+    if isinstance(error, (ConnectionFailure, ExecutionTimeout, WTimeoutError, asyncio.TimeoutError)):
+        return True
+    return isinstance(error, PyMongoError) and error.has_error_label("RetryableWriteError")
+
+
+class WriteBehindBuffer:
+    """
+    Queued documents for one collection, flushed every flush_interval seconds or as soon as
+    max_batch are waiting. Documents get their _id on add, so a retried batch can't insert
+    twice and readers can merge not-yet-flushed documents without duplicates.
+
+    A document the database rejects (validation, size) is dead-lettered instead of retried.
+    When a whole batch fails for a non-transient reason, each document is charged an attempt
+    and retried on its own, so one bad document can't hold back the rest; after max_attempts
+    it is dead-lettered. Transient failures (network, failover) are retried without limit.
+    """
+
+    def __init__(self, collection, max_batch: int = 200, flush_interval: float = 0.5,
+                 max_backlog: int = 20000, max_attempts: int = 5, enabled: bool = True):
+        self.collection = collection
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_backlog = max_backlog
+        self.max_attempts = max_attempts
+        self.enabled = enabled
+        self._queue: List[Dict] = []
+        self._pending_by_user: Dict[str, List[Dict]] = {}
+        self._queued_at: Dict[ObjectId, float] = {}
+        self._attempts: Dict[ObjectId, int] = {}  # non-transient failures so far, per document
+        self._dead_letters: Deque[Dict] = deque(maxlen=50)
+        self._unreachable = False  # the last flush stopped on a transient failure
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._prepare: Optional[Callable[[List[Dict]], Awaitable[None]]] = None
+        self._on_flushed: Optional[Callable[[List[str]], None]] = None
+        self._flush_stats = StageStats()
+        self._stats = {"queued": 0, "written": 0, "flushes": 0, "failed_flushes": 0, "requeued": 0,
+                       "dead_lettered": 0, "max_backlog_seen": 0, "max_wait_ms": 0.0}
+
+    def is_running(self) -> bool:
+        """Check if the background flusher has been started"""
+        return self._task is not None
+
+    async def start(self, prepare: Optional[Callable[[List[Dict]], Awaitable[None]]] = None,
+                    on_flushed: Optional[Callable[[List[str]], None]] = None):
+        """
+        Start the flusher. prepare(docs) runs before each insert (e.g. to fill in fields for
+        the whole batch at once); on_flushed(user_ids) runs after each successful write.
+        """
+        if not self.enabled or self._task:
+            return
+        self._prepare = prepare
+        self._on_flushed = on_flushed
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._flush_loop(), name="message-write-buffer")
+        print(f"[WRITE_BUFFER] Flushing {self.collection.name} every {self.flush_interval}s "
+              f"or {self.max_batch} documents")
+
+    async def stop(self):
+        """Stop the flusher and write everything still queued"""
+        if not self._task:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        # Non-transient failures converge (each retry charges an attempt); stop on an unreachable database
+        while self._queue:
+            if not await self.flush() and self._unreachable:
+                print(f"[WRITE_BUFFER] {len(self._queue)} documents could not be written on shutdown")
+                break
+
+    async def add(self, doc: Dict) -> ObjectId:
+        """Queue a document (must carry user_id) and return its _id"""
+        doc.setdefault("_id", ObjectId())
+        self._queue.append(doc)
+        self._pending_by_user.setdefault(doc["user_id"], []).append(doc)
+        self._queued_at[doc["_id"]] = time.perf_counter()
+        self._stats["queued"] += 1
+        self._stats["max_backlog_seen"] = max(self._stats["max_backlog_seen"], len(self._queue))
+
+        if len(self._queue) >= self.max_batch and self._wakeup is not None:
+            self._wakeup.set()
+        # Backpressure: don't let the queue grow without bound if the database falls behind
+        if len(self._queue) >= self.max_backlog:
+            await self.flush()
+        return doc["_id"]
+
+    def pending_for(self, user_id: str) -> List[Dict]:
+        """Queued documents for a user that are not in the database yet, newest first"""
+        return list(reversed(self._pending_by_user.get(user_id, [])))
+
+    def backlog(self) -> int:
+        return len(self._queue)
+
+    async def flush(self) -> bool:
+        """Write queued documents in insert_many batches; False if any document was requeued"""
+        async with self._flush_lock:
+            held: List[Dict] = []
+            self._unreachable = False
+            try:
+                while self._queue:
+                    # A document that failed before is retried alone, so it can't sink a whole batch again
+                    size = 1 if self._queue[0]["_id"] in self._attempts else self.max_batch
+                    batch, self._queue = self._queue[:size], self._queue[size:]
+                    try:
+                        failed, transient = await self._write(batch)
+                    except asyncio.CancelledError:
+                        # Stopped mid-write: keep the batch so the shutdown flush retries it
+                        held += batch
+                        raise
+                    held += failed
+                    if transient:
+                        self._unreachable = True
+                        break  # wait for the next flush
+            finally:
+                self._queue = held + self._queue
+            return not held
+
+    def get_stats(self) -> Dict:
+        """Get backlog, throughput and flush latency"""
+        now = time.perf_counter()
+        oldest = min(self._queued_at.values(), default=None)
+        return {
+            "enabled": self.enabled,
+            "running": self.is_running(),
+            "backlog": len(self._queue),
+            "retrying": len(self._attempts),
+            "users_pending": len(self._pending_by_user),
+            "oldest_pending_ms": round((now - oldest) * 1000, 2) if oldest is not None else 0.0,
+            **self._stats,
+            "avg_batch": round(self._stats["written"] / self._stats["flushes"], 1) if self._stats["flushes"] else 0.0,
+            "flush_latency": self._flush_stats.to_dict(),
+            "recent_dead_letters": list(self._dead_letters)
+        }
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._queue:
+                await self.flush()
+
+    async def _write(self, batch: List[Dict]) -> Tuple[List[Dict], bool]:
+        """Insert one batch; returns (documents to retry, whether the failure was transient)"""
+        started = time.perf_counter()
+        failed: List[Dict] = []
+        dead: List[Tuple[Dict, str]] = []
+        transient = False
+        try:
+            if self._prepare:
+                await self._prepare(batch)
+            await self.collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Duplicate _ids were already written by an earlier attempt; any other per-document
+            # error (validation, size) would fail the same way on every retry
+            for error in e.details.get("writeErrors", []):
+                if error.get("code") != DUPLICATE_KEY_ERROR:
+                    dead.append((batch[error["index"]], error.get("errmsg", "write error")))
+        except Exception as e:
+            if is_transient_error(e):
+                print(f"[WRITE_BUFFER] Flush of {len(batch)} documents failed, will retry: {e}")
+                transient = True
+                failed = batch
+            else:
+                print(f"[WRITE_BUFFER] Flush of {len(batch)} documents failed: {e}")
+                for doc in batch:
+                    attempts = self._attempts.get(doc["_id"], 0) + 1
+                    if attempts >= self.max_attempts:
+                        dead.append((doc, str(e)))
+                    else:
+                        self._attempts[doc["_id"]] = attempts
+                        failed.append(doc)
+
+        elapsed = time.perf_counter() - started
+        self._flush_stats.record(elapsed)
+        if failed:
+            self._stats["failed_flushes"] += 1
+            self._stats["requeued"] += len(failed)
+        for doc, reason in dead:
+            self._dead_letter(doc, reason)
+
+        unsettled = {doc["_id"] for doc in failed}
+        dead_ids = {doc["_id"] for doc, _ in dead}
+        written = [doc for doc in batch if doc["_id"] not in unsettled and doc["_id"] not in dead_ids]
+        now = time.perf_counter()
+        for doc in written:
+            queued_at = self._queued_at.get(doc["_id"], now)
+            self._stats["max_wait_ms"] = max(self._stats["max_wait_ms"], round((now - queued_at) * 1000, 2))
+        for doc in batch:
+            if doc["_id"] not in unsettled:
+                self._settle(doc)
+
+        if written:
+            self._stats["flushes"] += 1
+            self._stats["written"] += len(written)
+            if self._on_flushed:
+                self._on_flushed(list({doc["user_id"] for doc in written}))
+        return failed, transient
+
+    def _settle(self, doc: Dict):
+        """Forget a document that was written or dead-lettered"""
+        self._queued_at.pop(doc["_id"], None)
+        self._attempts.pop(doc["_id"], None)
+        pending = self._pending_by_user.get(doc["user_id"])
+        if pending is not None:
+            pending.remove(doc)
+            if not pending:
+                del self._pending_by_user[doc["user_id"]]
+
+    def _dead_letter(self, doc: Dict, reason: str):
+        """Give up on a document: log it and keep a short record for /debug/write-buffer"""
+        self._stats["dead_lettered"] += 1
+        text = str(doc.get("message", ""))
+        self._dead_letters.append({
+            "_id": str(doc["_id"]),
+            "user_id": doc.get("user_id", ""),
+            "error": reason[:300],
+            "message_preview": text[:100]
+        })
+        print(f"[WRITE_BUFFER] Dead-lettered message {doc['_id']} for {doc.get('user_id', '')} "
+              f"({reason[:200]}): {text[:200]!r}")
@@ -1,7 +1,7 @@
 from app.config import settings
-import requests
+from app.services.media_fetcher import media_fetcher
 import re
-from app.config import settings
+import unicodedata
 
 TWILIO_ACCOUNT_SID = settings.TWILIO_ACCOUNT_SID
 TWILIO_AUTH_TOKEN = settings.TWILIO_AUTH_TOKEN
@@ -20,148 +20,163 @@ def is_hindi_english_mixed(text: str) -> bool:
 
 
 
+# Separators tried in order when a piece is too long for one message
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?\u0964\u0965])(\s+)')  # keeps the sentence's own punctuation (incl. । ॥)
+_WORD_SPLIT = re.compile(r'(\s+)')
+
+VIRAMA = '\u094d'
+JOINERS = ('\u200c', '\u200d')
+
+
+def _is_grapheme_boundary(text: str, index: int) -> bool:
+    """True if text can be cut before text[index] without splitting a character cluster"""
+    if index <= 0 or index >= len(text):
+        return True
+    # Vowel signs, nukta, anusvara and other combining marks belong to the preceding letter
+    if unicodedata.category(text[index]) in ('Mn', 'Mc', 'Me') or text[index] in JOINERS or text[index] == '\ufe0f':
+        return False
+    # A virama (or joiner) binds the next consonant into the same conjunct
+    return text[index - 1] != VIRAMA and text[index - 1] not in JOINERS
+
+
+def _hard_split(text: str, max_length: int):
+    """Cut text into max_length pieces, backing off to the nearest grapheme boundary"""
+    start = 0
+    while len(text) - start > max_length:
+        end = start + max_length
+        while end > start and not _is_grapheme_boundary(text, end):
+            end -= 1
+        if end == start:
+            end = start + max_length
+        yield text[start:end]
+        start = end
+    yield text[start:]
+
+
+def _split_pieces(text: str, separator: str, max_length: int, level: int = 0):
+    """
+    Yield (separator, piece) pairs, each piece at most max_length, splitting an over-long
+    piece by lines, then sentences, then words, then grapheme-safe hard cuts.
+    separator is what joins the piece to the one before it.
+    """
+    if len(text) <= max_length:
+        yield separator, text
+        return
+
+    if level == 0:
+        parts = text.split('\n')
+        pieces = [('\n', part) for part in parts]
+    elif level in (1, 2):
+        parts = (_SENTENCE_SPLIT if level == 1 else _WORD_SPLIT).split(text)
+        # re.split with a group alternates piece, separator, piece, ...
+        pieces = [(parts[i - 1] if i else ' ', parts[i]) for i in range(0, len(parts), 2)]
+    else:
+        pieces = [('', part) for part in _hard_split(text, max_length)]
+
+    first = True
+    for piece_separator, piece in pieces:
+        if not piece:
+            continue
+        yield from _split_pieces(piece, separator if first else piece_separator, max_length, level + 1)
+        first = False
+
+
+class WhatsAppChunker:
+    """
+    Incremental chunk packer behind iter_whatsapp_chunks. Text can be fed as it streams in:
+    once a paragraph is complete it is packed, and a chunk is returned as soon as the next
+    paragraph no longer fits in it.
+    """
+
+    def __init__(self, max_length: int = 1500):
+        self.max_length = max_length
+        self._buffer = ""  # text after the last complete paragraph
+        self._parts = []
+        self._length = 0
+
+    def feed(self, text: str) -> list:
+        """Add streamed text; returns the chunks it closed"""
+        search_from = max(len(self._buffer) - 1, 0)
+        self._buffer += text
+        if self._buffer.find('\n\n', search_from) < 0:
+            return []
+        # Split exactly like message.split('\n\n'), so streamed and whole replies chunk the same
+        *complete, self._buffer = self._buffer.split('\n\n')
+        chunks = []
+        for paragraph in complete:
+            chunks.extend(self.add_paragraph(paragraph))
+        return chunks
+
+    def add_paragraph(self, paragraph: str):
+        """Pack one complete paragraph, yielding any chunk it closes"""
+        if not paragraph.strip():
+            return
+        for separator, piece in _split_pieces(paragraph, '\n\n', self.max_length):
+            added = len(piece) + (len(separator) if self._parts else 0)
+            if self._parts and self._length + added > self.max_length:
+                chunk = ''.join(self._parts).strip()
+                if chunk:
+                    yield chunk
+                self._parts, self._length = [], 0
+                added = len(piece)
+            self._parts.append(separator + piece if self._parts else piece)
+            self._length += added
+
+    def flush(self) -> list:
+        """Flush the paragraphs packed so far, keeping the unfinished one buffered"""
+        chunk = ''.join(self._parts).strip()
+        self._parts, self._length = [], 0
+        return [chunk] if chunk else []
+
+    def close(self) -> list:
+        """Flush the unfinished paragraph and the last chunk"""
+        chunks = list(self.add_paragraph(self._buffer))
+        self._buffer = ""
+        chunk = ''.join(self._parts).strip()
+        self._parts, self._length = [], 0
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+
+def iter_whatsapp_chunks(message: str, max_length: int = 1500):
+    """
+    Yield WhatsApp-sized chunks of message in a single pass, so sending can start before the
+    whole reply is split. Paragraphs are packed together; longer ones are split by lines,
+    sentences, words and finally grapheme-safe cuts.
+    """
+    chunker = WhatsAppChunker(max_length)
+    for paragraph in message.split('\n\n'):
+        yield from chunker.add_paragraph(paragraph)
+    yield from chunker.close()
+
+
 def format_whatsapp_message(message: str, max_length: int = 1500) -> list:
     """Smart message formatting for WhatsApp with Twilio limits"""
     # Twilio's actual limit is 1600 characters, but we use 1500 for safety
     if len(message) <= max_length:
         return [message]
-    
-    chunks = []
-    
-    # First try to split by double newlines (paragraphs/sections)
-    sections = message.split('\n\n')
-    current_chunk = ""
-    
-    for section in sections:
-        # If adding this section exceeds limit
-        if len(current_chunk + '\n\n' + section) > max_length:
-            # Save current chunk if it has content
-            if current_chunk.strip():
-                chunks.append(current_chunk.strip())
-            
-            # If section itself is too long, split it further
-            if len(section) > max_length:
-                # Split by single newlines
-                lines = section.split('\n')
-                temp_chunk = ""
-                for line in lines:
-                    if len(temp_chunk + '\n' + line) > max_length:
-                        if temp_chunk.strip():
-                            chunks.append(temp_chunk.strip())
-                        temp_chunk = line
-                    else:
-                        temp_chunk += '\n' + line if temp_chunk else line
-                
-                if temp_chunk.strip():
-                    current_chunk = temp_chunk
-                else:
-                    current_chunk = ""
-            else:
-                current_chunk = section
-        else:
-            current_chunk += '\n\n' + section if current_chunk else section
-    
-    # Add any remaining content
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
-    
-    # Final check - if any chunk is still too long, split by sentences
-    final_chunks = []
-    for chunk in chunks:
-        if len(chunk) <= max_length:
-            final_chunks.append(chunk)
-        else:
-            # Split by sentences (. or ! or ?)
-            sentences = []
-            temp_sentences = chunk.replace('!', '.').replace('?', '.').split('.')
-            for sent in temp_sentences:
-                if sent.strip():
-                    sentences.append(sent.strip() + '.')
-            
-            temp_chunk = ""
-            for sentence in sentences:
-                if len(temp_chunk + ' ' + sentence) > max_length:
-                    if temp_chunk.strip():
-                        final_chunks.append(temp_chunk.strip())
-                    temp_chunk = sentence
-                else:
-                    temp_chunk += ' ' + sentence if temp_chunk else sentence
-            
-            if temp_chunk.strip():
-                final_chunks.append(temp_chunk.strip())
-    
-    return final_chunks if final_chunks else [message[:max_length]]
-
-
-
-def download_twilio_media(media_url: str) -> bytes:
-    """Download media from Twilio with proper authentication"""
+
+    chunks = list(iter_whatsapp_chunks(message, max_length))
+    return chunks if chunks else [message[:max_length]]
+
+
+
+async def download_twilio_media(media_url: str) -> bytes:
+    """Download media from Twilio with proper authentication (streamed, size-capped, pooled)"""
+    if not TWILIO_ACCOUNT_SID or not TWILIO_AUTH_TOKEN:
+        raise ValueError(f"Missing credentials: SID={'Present' if TWILIO_ACCOUNT_SID else 'Missing'}, Token={'Present' if TWILIO_AUTH_TOKEN else 'Missing'}")
+
+    # Validate that SID starts with 'AC' (Twilio Account SID format)
+    if not TWILIO_ACCOUNT_SID.startswith('AC'):
+        raise ValueError(f"Invalid Account SID format. Should start with 'AC', got: {TWILIO_ACCOUNT_SID[:5]}...")
+
+    print(f"[DEBUG] Media URL: {media_url}")
+
     try:
-        # Debug: Check if credentials are loaded
-        if not TWILIO_ACCOUNT_SID or not TWILIO_AUTH_TOKEN:
-            raise ValueError(f"Missing credentials: SID={'Present' if TWILIO_ACCOUNT_SID else 'Missing'}, Token={'Present' if TWILIO_AUTH_TOKEN else 'Missing'}")
-        
-        print(f"[DEBUG] Using Account SID: {TWILIO_ACCOUNT_SID[:8]}...")
-        print(f"[DEBUG] Token length: {len(TWILIO_AUTH_TOKEN) if TWILIO_AUTH_TOKEN else 0}")
-        print(f"[DEBUG] Media URL: {media_url}")
-        
-        # Validate that SID starts with 'AC' (Twilio Account SID format)
-        if not TWILIO_ACCOUNT_SID.startswith('AC'):
-            raise ValueError(f"Invalid Account SID format. Should start with 'AC', got: {TWILIO_ACCOUNT_SID[:5]}...")
-        
-        # Method 1: Basic authentication with requests.auth
-        response = requests.get(
-            media_url,
-            auth=(str(TWILIO_ACCOUNT_SID), str(TWILIO_AUTH_TOKEN)),
-            timeout=30,
-            headers={
-                'User-Agent': 'TwilioMediaDownloader/1.0',
-                'Accept': 'image/*'
-            }
-        )
-        
-        print(f"[DEBUG] Response status: {response.status_code}")
-        
-        if response.status_code == 200:
-            print(f"[DEBUG] Successfully downloaded {len(response.content)} bytes")
-            return response.content
-        
-        # If 401, the credentials are definitely wrong
-        if response.status_code == 401:
-            print(f"[DEBUG] Authentication failed. Response: {response.text[:500]}")
-            raise ValueError(f"Twilio authentication failed. Check your ACCOUNT_SID and AUTH_TOKEN. SID: {TWILIO_ACCOUNT_SID[:8]}...")
-            
-        # For other status codes, try alternative method
-        print(f"[DEBUG] First method failed with status {response.status_code}, trying alternative...")
-        
-        # Method 2: Manual Authorization header
-        import base64
-        credentials = base64.b64encode(f"{TWILIO_ACCOUNT_SID}:{TWILIO_AUTH_TOKEN}".encode()).decode()
-        
-        response = requests.get(
-            media_url,
-            headers={
-                'Authorization': f'Basic {credentials}',
-                'User-Agent': 'TwilioMediaDownloader/1.0',
-                'Accept': 'image/*'
-            },
-            timeout=30
-        )
-        
-        print(f"[DEBUG] Alternative method status: {response.status_code}")
-        
-        if response.status_code == 200:
-            return response.content
-            
-        # If still failing, provide detailed error
-        raise ValueError(f"Failed to download image. Status: {response.status_code}, Response: {response.text[:300]}")
-        
-    except requests.exceptions.Timeout:
-        raise ValueError("Image download timed out after 30 seconds")
-    except requests.exceptions.ConnectionError as e:
-        raise ValueError(f"Connection error while downloading image: {str(e)}")
+        return await media_fetcher.fetch(media_url)
     except ValueError:
         # Re-raise ValueError as-is
         raise
     except Exception as e:
-        raise ValueError(f"Unexpected error during image download: {str(e)}")
\ No newline at end of file
+        raise ValueError(f"Unexpected error during image download: {str(e)}")